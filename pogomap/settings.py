@@ -30,6 +30,9 @@ DEBUG = os.getenv("DEBUG", "true").lower() in ['yes', '1', 'true']
 
 ALLOWED_HOSTS = []
 
+# Identifier of the deployed version, it is a part of ETag of pages
+RELEASE = os.getenv("RELEASE", "")
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -52,6 +55,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ['yes', '1', 'true']
+
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'pokemon_entities.middleware.MetricsMiddleware')
+
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(',')
+
 ROOT_URLCONF = 'pogomap.urls'
 
 TEMPLATES = [
@@ -78,8 +88,38 @@ WSGI_APPLICATION = 'pogomap.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'ENGINE': os.getenv("DB_ENGINE", 'django.db.backends.sqlite3'),
+        'NAME': os.getenv("DB_NAME", os.path.join(BASE_DIR, 'db.sqlite3')),
+        'HOST': os.getenv("DB_HOST", ''),
+        'PORT': os.getenv("DB_PORT", ''),
+        'USER': os.getenv("DB_USER", ''),
+        'PASSWORD': os.getenv("DB_PASSWORD", ''),
+    }
+}
+
+# Read replicas: paths to files for SQLite, hosts (host or host:port) for other databases
+for number, replica in enumerate(filter(None, os.getenv("DB_REPLICAS", "").split(',')), start=1):
+    replica_settings = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if replica_settings['ENGINE'] == 'django.db.backends.sqlite3':
+        replica_settings['NAME'] = replica
+    else:
+        replica_settings['HOST'], _, replica_port = replica.partition(':')
+        replica_settings['PORT'] = replica_port or replica_settings['PORT']
+    DATABASES['replica_{0}'.format(number)] = replica_settings
+
+DATABASE_ROUTERS = ['pokemon_entities.db_router.PrimaryReplicaRouter']
+
+# How many seconds maps may lag behind writes when they are read from replicas
+DB_REPLICA_STALENESS = int(os.getenv("DB_REPLICA_STALENESS", "5"))
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("CACHE_LOCATION", ''),
     }
 }
 
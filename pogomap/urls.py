@@ -9,6 +9,14 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.show_all_pokemons, name="mainpage"),
     path('pokemon/<pokemon_id>/', views.show_pokemon, name="pokemon"),
+    path('api/entities/', views.show_pokemon_entities, name="api_entities"),
+    path('api/entities/nearest/', views.show_nearest_pokemon_entities, name="api_nearest_entities"),
+    path('api/entities/stream/', views.show_pokemon_entities_stream, name="api_entities_stream"),
+    path('tiles/<int:zoom>/<int:x>/<int:y>.mvt', views.show_tile, name="tile"),
+    path('api/heatmap/', views.show_heatmap, name="api_heatmap"),
+    path('api/counters/', views.show_counters, name="api_counters"),
+    path('api/pokemon/<int:pokemon_id>/counters/', views.show_counters, name="api_pokemon_counters"),
+    path('metrics/', views.show_metrics, name="metrics"),
 ]
 
 
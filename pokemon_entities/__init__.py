@@ -0,0 +1 @@
+default_app_config = 'pokemon_entities.apps.PokemonEntitiesConfig'
@@ -1,7 +1,259 @@
+from collections import Counter
+from datetime import timedelta
+
 from django.contrib import admin
-from .models import Pokemon, PokemonEntity, PokemonElementType
+from django.contrib import messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from pokemon_entities.heatmap import add_to_rollup
+from pokemon_entities.heatmap import count_spawns
+from pokemon_entities.map_cache import invalidate_entities
+from .models import Pokemon, PokemonEntity, PokemonElementType, PokemonEntityArchive
+from .models import delete_entities_by_ids
+
+
+ADMIN_CHUNK_SIZE = 10000
+ESTIMATED_COUNT_LIMIT = 100000
+SHIFT_INTERVAL = timedelta(hours=1)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator which doesn't count rows of the whole table.
+
+    Number of rows of unfiltered changelist is taken from statistics of the database
+    (PostgreSQL, MySQL), which is instant even for millions of rows. Filtered changelists and
+    tables of other databases count not more than ESTIMATED_COUNT_LIMIT rows, is_count_limited
+    shows that the limit was hit.
+    """
+
+    is_count_limited = False
+
+    def get_limited_count(self, queryset):
+        count = queryset.order_by()[:ESTIMATED_COUNT_LIMIT].count()
+        self.is_count_limited = count >= ESTIMATED_COUNT_LIMIT
+        return count
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if queryset.query.where or connection.vendor not in ['postgresql', 'mysql']:
+            return self.get_limited_count(queryset)
+
+        table = queryset.model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+            else:
+                cursor.execute('SELECT table_rows FROM information_schema.tables '
+                               'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+            row = cursor.fetchone()
+        estimated_count = int(row[0] or 0) if row else 0
+        if estimated_count < ESTIMATED_COUNT_LIMIT:
+            return queryset.count()
+        return estimated_count
+
+
+class EstimatedCountAdminMixin:
+    """Admin with EstimatedCountPaginator which tells when the changelist has more rows than counted."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None and changelist.paginator.is_count_limited:
+            self.message_user(request, 'Записей больше {0}, страницы есть только для первых {0}'.format(
+                ESTIMATED_COUNT_LIMIT), messages.INFO)
+        return response
+
+
+class ActiveWindowFilter(admin.SimpleListFilter):
+    """Filter of pokemon entities by time when they are on the map, uses index on (disappear_at, appear_at)."""
+
+    title = 'Время на карте'
+    parameter_name = 'window'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('active', 'На карте сейчас'),
+            ('upcoming', 'Ещё не появились'),
+            ('expired', 'Уже исчезли'),
+        ]
+
+    def queryset(self, request, queryset):
+        now = timezone.now()
+        if self.value() == 'active':
+            return queryset.active(now)
+        if self.value() == 'upcoming':
+            return queryset.filter(appear_at__gt=now)
+        if self.value() == 'expired':
+            return queryset.filter(disappear_at__lt=now)
+        return queryset
+
+
+def iter_id_chunks(queryset, chunk_size=ADMIN_CHUNK_SIZE):
+    """Give ids of objects of queryset by chunks, every chunk is read by one indexed query.
+
+    Chunks are read by keyset pagination on id, so objects which are changed by previous
+    chunks and leave or enter the queryset are not visited twice.
+
+    :param queryset: objects to iterate
+    :type: QuerySet
+    :param chunk_size: max number of ids in chunk
+    :type: int
+    :return: generator of lists of ids
+    :type: generator
+    """
+    ids = queryset.order_by('id').values_list('id', flat=True)
+    last_id = None
+    while True:
+        chunk_ids = ids if last_id is None else ids.filter(id__gt=last_id)
+        chunk = list(chunk_ids[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]
+
+
+def shift_entities(queryset, shift):
+    """Move appear_at and disappear_at of pokemon entities by shift with set-based updates.
+
+    :param queryset: pokemon entities
+    :type: PokemonEntityQuerySet
+    :param shift: interval to add to time of entities
+    :type: timedelta
+    :return: number of changed entities
+    :type: int
+    """
+    now = timezone.now()
+    changed_count = 0
+    for chunk in iter_id_chunks(queryset):
+        with transaction.atomic():
+            spawns = list(PokemonEntity.objects.filter(id__in=chunk).values_list(
+                'pokemon_id', 'tile_key', 'appear_at'))
+            deltas = count_spawns((pokemon_id, tile_key, appear_at and appear_at + shift)
+                                  for pokemon_id, tile_key, appear_at in spawns)
+            deltas.subtract(count_spawns(spawns))
+            changed_count += PokemonEntity.objects.filter(id__in=chunk).update(
+                appear_at=F('appear_at') + shift, disappear_at=F('disappear_at') + shift, updated_at=now)
+            add_to_rollup(deltas)
+    return changed_count
+
+
+def expire_entities(queryset):
+    """Make pokemon entities disappear now with set-based updates.
+
+    Upcoming entities get disappear_at earlier than appear_at, so they never appear.
+
+    :param queryset: pokemon entities
+    :type: PokemonEntityQuerySet
+    :return: number of changed entities
+    :type: int
+    """
+    now = timezone.now()
+    changed_count = 0
+    for chunk in iter_id_chunks(queryset.filter(disappear_at__gt=now)):
+        changed_count += PokemonEntity.objects.filter(id__in=chunk).update(disappear_at=now, updated_at=now)
+    return changed_count
+
+
+def delete_entities(queryset):
+    """Delete pokemon entities by chunks without loading them and without per-object signals.
+
+    Counts of deleted entities are removed from spawn heatmaps.
+
+    :param queryset: pokemon entities
+    :type: PokemonEntityQuerySet
+    :return: number of deleted entities
+    :type: int
+    """
+    deleted_count = 0
+    for chunk in iter_id_chunks(queryset):
+        with transaction.atomic():
+            chunk_entities = PokemonEntity.objects.filter(id__in=chunk)
+            counts = count_spawns(chunk_entities.values_list('pokemon_id', 'tile_key', 'appear_at'))
+            deleted_count += delete_entities_by_ids(chunk)
+            add_to_rollup(Counter({key: -count for key, count in counts.items()}))
+    return deleted_count
+
+
+@admin.register(Pokemon)
+class PokemonAdmin(admin.ModelAdmin):
+    list_display = ['id', 'title', 'title_en', 'previous_evolution']
+    list_select_related = ['previous_evolution']
+    search_fields = ['title', 'title_en', 'title_jp']
+    autocomplete_fields = ['previous_evolution']
+    filter_horizontal = ['element_type']
+
+
+@admin.register(PokemonElementType)
+class PokemonElementTypeAdmin(admin.ModelAdmin):
+    list_display = ['id', 'title']
+    search_fields = ['title']
+    filter_horizontal = ['strong_against']
+
+
+@admin.register(PokemonEntity)
+class PokemonEntityAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+    """Admin of pokemon entities which works with millions of rows.
+
+    The changelist loads species by join, doesn't count the whole table (see
+    EstimatedCountPaginator) and is filtered by indexed fields. Actions change selected
+    entities by chunks of set-based queries instead of loading and saving every object.
+    """
+
+    list_display = ['id', 'pokemon', 'latitude', 'longitude', 'appear_at', 'disappear_at', 'level']
+    list_select_related = ['pokemon']
+    list_filter = [ActiveWindowFilter, 'pokemon']
+    autocomplete_fields = ['pokemon']
+    ordering = ['-id']
+    actions = ['expire_selected', 'shift_later', 'shift_earlier', 'delete_in_chunks']
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def expire_selected(self, request, queryset):
+        changed_count = expire_entities(queryset)
+        invalidate_entities()
+        self.message_user(request, 'Исчезли покемонов: {0}'.format(changed_count))
+    expire_selected.short_description = 'Убрать с карты сейчас'
+    expire_selected.allowed_permissions = ['change']
+
+    def shift_later(self, request, queryset):
+        changed_count = shift_entities(queryset, SHIFT_INTERVAL)
+        invalidate_entities()
+        self.message_user(request, 'Перенесено покемонов: {0}'.format(changed_count))
+    shift_later.short_description = 'Перенести на час позже'
+    shift_later.allowed_permissions = ['change']
+
+    def shift_earlier(self, request, queryset):
+        changed_count = shift_entities(queryset, -SHIFT_INTERVAL)
+        invalidate_entities()
+        self.message_user(request, 'Перенесено покемонов: {0}'.format(changed_count))
+    shift_earlier.short_description = 'Перенести на час раньше'
+    shift_earlier.allowed_permissions = ['change']
+
+    def delete_in_chunks(self, request, queryset):
+        deleted_count = delete_entities(queryset)
+        invalidate_entities()
+        self.message_user(request, 'Удалено покемонов: {0}'.format(deleted_count))
+    delete_in_chunks.short_description = 'Удалить выбранных покемонов'
+    delete_in_chunks.allowed_permissions = ['delete']
 
 
-admin.site.register(Pokemon)
-admin.site.register(PokemonEntity)
-admin.site.register(PokemonElementType)
+@admin.register(PokemonEntityArchive)
+class PokemonEntityArchiveAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+    list_display = ['id', 'entity_id', 'pokemon', 'appear_at', 'disappear_at', 'archived_at']
+    list_select_related = ['pokemon']
+    list_filter = ['pokemon']
+    raw_id_fields = ['pokemon']
+    ordering = ['-id']
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PokemonEntitiesConfig(AppConfig):
     name = 'pokemon_entities'
+
+    def ready(self):
+        from pokemon_entities import signals  # noqa: F401
@@ -0,0 +1,149 @@
+"""Cached catalogue of pokemon species.
+
+The catalogue is kept in Django cache under the key with version. The version is made of the
+database (last updated_at and number of species, element types and links between them) and of
+the sprite sheet, so all processes get the same version whether the cache is shared or not, and
+the old catalogue is not used anymore after any change and expires by itself. The version is
+read once in CATALOGUE_VERSION_TTL by every process and at once after changes made by the process
+itself (see signals.py), so with warm cache getting the catalogue costs one cache read.
+"""
+
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models import Max
+
+from pokemon_entities.db_router import replica_reads
+from pokemon_entities.images import get_image_url
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonElementType
+from pokemon_entities.sprites import read_sprite_manifest
+
+
+CATALOGUE_VERSION_TTL = 5
+CATALOGUE_KEY = 'species_catalogue:{version}'
+SPRITE_SHEET_KEY = 'species_sprite_sheet:{version}'
+CATALOGUE_TIMEOUT = 24 * 60 * 60
+
+
+catalogue_version = None
+catalogue_version_lock = threading.Lock()
+
+
+@replica_reads(False)
+def read_catalogue_version():
+    """Give version of species catalogue made of the database and the sprite sheet.
+
+    m2m links have no timestamps, so their number and max id are used. Costs four aggregate
+    queries to the primary database and reading of the sprite manifest.
+
+    :return: version of species catalogue
+    :type: string
+    """
+    version_parts = [
+        Pokemon.objects.aggregate(Max('updated_at'), Count('id')),
+        PokemonElementType.objects.aggregate(Max('updated_at'), Count('id')),
+        Pokemon.element_type.through.objects.aggregate(Max('id'), Count('id')),
+        PokemonElementType.strong_against.through.objects.aggregate(Max('id'), Count('id')),
+        (read_sprite_manifest() or {}).get('url'),
+    ]
+    return hashlib.md5(repr(version_parts).encode('utf-8')).hexdigest()
+
+
+def get_catalogue_version():
+    """Give current version of species catalogue, it is read again once in CATALOGUE_VERSION_TTL.
+
+    :return: version of species catalogue
+    :type: string
+    """
+    global catalogue_version
+    current_version = catalogue_version
+    if current_version is not None and current_version[1] > time.monotonic():
+        return current_version[0]
+    with catalogue_version_lock:
+        if catalogue_version is None or catalogue_version[1] <= time.monotonic():
+            catalogue_version = (read_catalogue_version(), time.monotonic() + CATALOGUE_VERSION_TTL)
+        return catalogue_version[0]
+
+
+def invalidate_species_catalogue():
+    """Read version of species catalogue again, so changes of this process are seen at once.
+
+    Other processes see the changes in CATALOGUE_VERSION_TTL.
+    """
+    global catalogue_version
+    catalogue_version = None
+
+
+@replica_reads(False)
+def get_specie_info(pokemon, sprite_positions=None):
+    """Give info about pokemon specie like in species catalogue.
+
+    :param pokemon: pokemon specie
+    :type: Pokemon
+    :param sprite_positions: positions of icons in the sprite sheet like {'pokemon_id': [x, y]}
+    :type: dict
+    :return: dict with keys pokemon_id, img_url, img_webp_url, title_ru and sprite_position
+    :type: dict
+    """
+    return {
+        'pokemon_id': pokemon.id,
+        'img_url': get_image_url(pokemon, 'icon'),
+        'img_webp_url': get_image_url(pokemon, 'icon', 'webp'),
+        'title_ru': pokemon.title,
+        'sprite_position': (sprite_positions or {}).get(str(pokemon.id)),
+    }
+
+
+def build_species_catalogue():
+    """Give info about all pokemon species from DB.
+
+    The catalogue is cached until species change, so it is read from the primary database.
+
+    :return: list of dicts with keys pokemon_id, img_url, img_webp_url, title_ru and sprite_position
+             (position of icon in the sprite sheet or None)
+    :type: list
+    """
+    sprite_manifest = read_sprite_manifest() or {}
+    sprite_positions = sprite_manifest.get('positions', {})
+    return [get_specie_info(pokemon, sprite_positions) for pokemon in Pokemon.objects.order_by('id')]
+
+
+def get_species_catalogue():
+    """Give info about all pokemon species, from cache if possible.
+
+    :return: list of dicts with keys pokemon_id, img_url, img_webp_url, title_ru and sprite_position
+    :type: list
+    """
+    catalogue_key = CATALOGUE_KEY.format(version=get_catalogue_version())
+    species = cache.get(catalogue_key)
+    if species is None:
+        species = build_species_catalogue()
+        cache.set(catalogue_key, species, CATALOGUE_TIMEOUT)
+    return species
+
+
+def get_species_by_id():
+    """Give info about all pokemon species by pokemon id.
+
+    :return: dict like {pokemon_id: {'pokemon_id': ..., 'img_url': ..., 'img_webp_url': ..., 'title_ru': ...}}
+    :type: dict
+    """
+    return {specie['pokemon_id']: specie for specie in get_species_catalogue()}
+
+
+def get_sprite_sheet():
+    """Give manifest of the sprite sheet with icons of species, from cache if possible.
+
+    :return: dict with keys url, css_url, icon_size and positions, None if there is no sprite sheet
+    :type: dict
+    """
+    sprite_sheet_key = SPRITE_SHEET_KEY.format(version=get_catalogue_version())
+    sprite_sheet = cache.get(sprite_sheet_key)
+    if sprite_sheet is None:
+        sprite_sheet = read_sprite_manifest() or {}
+        cache.set(sprite_sheet_key, sprite_sheet, CATALOGUE_TIMEOUT)
+    return sprite_sheet or None
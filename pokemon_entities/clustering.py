@@ -0,0 +1,83 @@
+"""Grid clustering of pokemon entities.
+
+Entities are grouped by cells: Web Mercator tiles of zoom (map zoom + CLUSTER_CELL_ZOOM_OFFSET),
+i.e. squares of 64x64 pixels on the screen. A cell is a range of tile keys, so rows of the
+spawn snapshot (see snapshot.py) are grouped by shifted tile keys with vectorized NumPy
+operations, without loops over entities.
+"""
+
+import numpy as np
+
+from pokemon_entities import geo
+from pokemon_entities.snapshot import get_entity_values
+
+
+CLUSTER_MIN_ZOOM = 10
+CLUSTER_MAX_ZOOM = 15
+CLUSTER_CELL_ZOOM_OFFSET = 2
+
+
+def cluster_rows(rows, zoom):
+    """Group rows of spawn snapshot into clusters for the map of zoom level.
+
+    A cell with only one entity gives the entity itself instead of cluster. The most common 
+    specie of a cluster is the one with the least pokemon_id among equally common ones.
+
+    :param rows: rows of spawn snapshot
+    :type: ndarray
+    :param zoom: zoom level of the map
+    :type: int
+    :return: tuple (clusters, entities), clusters is list of dicts with keys latitude, longitude,
+             count and pokemon_id (the most common specie in the cluster), entities is list of
+             rows of ENTITY_FIELDS values of entities which are alone in their cells
+    :type: tuple
+    """
+    if not len(rows):
+        return [], []
+    cell_zoom = min(zoom + CLUSTER_CELL_ZOOM_OFFSET, geo.TILE_KEY_ZOOM)
+    cells = rows['tile_key'] >> (2 * (geo.TILE_KEY_ZOOM - cell_zoom))
+    cell_ids, cell_indexes, counts = np.unique(cells, return_inverse=True, return_counts=True)
+    cell_indexes = cell_indexes.reshape(-1)
+    latitudes = np.bincount(cell_indexes, weights=rows['latitude'], minlength=len(cell_ids)) / counts
+    longitudes = np.bincount(cell_indexes, weights=rows['longitude'], minlength=len(cell_ids)) / counts
+
+    cell_species, species_counts = np.unique(
+        np.stack([cell_indexes, rows['pokemon_id']], axis=1), axis=0, return_counts=True)
+    order = np.lexsort((cell_species[:, 1], -species_counts, cell_species[:, 0]))
+    cell_species = cell_species[order]
+    is_first = np.ones(len(cell_species), dtype=bool)
+    is_first[1:] = cell_species[1:, 0] != cell_species[:-1, 0]
+    common_species = cell_species[is_first, 1]
+
+    is_cluster = counts > 1
+    clusters = [
+        {'latitude': latitude, 'longitude': longitude, 'count': count, 'pokemon_id': pokemon_id}
+        for latitude, longitude, count, pokemon_id in zip(
+            latitudes[is_cluster].tolist(),
+            longitudes[is_cluster].tolist(),
+            counts[is_cluster].tolist(),
+            common_species[is_cluster].tolist(),
+        )
+    ]
+    is_alone = ~is_cluster[cell_indexes]
+    alone_rows = rows[is_alone][np.argsort(cells[is_alone], kind='stable')]
+    return clusters, get_entity_values(alone_rows)
+
+
+def get_clusters_by_zoom(rows):
+    """Give clusters of pokemon entities for every zoom level where they are clustered.
+
+    :param rows: rows of spawn snapshot to group
+    :type: ndarray
+    :return: dict like {zoom: {'clusters': [[lat, lon, count, pokemon_id], ...], 'entities': [ids]}}
+    :type: dict
+    """
+    clusters_by_zoom = {}
+    for zoom in range(CLUSTER_MIN_ZOOM, CLUSTER_MAX_ZOOM):
+        clusters, entities = cluster_rows(rows, zoom)
+        clusters_by_zoom[zoom] = {
+            'clusters': [[cluster['latitude'], cluster['longitude'], cluster['count'], cluster['pokemon_id']]
+                         for cluster in clusters],
+            'entities': [entity[0] for entity in entities],
+        }
+    return clusters_by_zoom
@@ -0,0 +1,79 @@
+"""Routing of database queries between the primary database and read replicas.
+
+Replicas are all databases except 'default' (see DB_REPLICAS setting). Writes, migrations and
+reads inside of transactions go to the primary database. Other reads go to a replica only inside
+of replica_reads(), which marks views serving maps and species: they may show data up to
+DB_REPLICA_STALENESS seconds old, and don't wait for locks taken by imports of spawns.
+Management commands and admin don't use replica_reads(), so they work with the primary database.
+"""
+
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
+
+
+routing_state = threading.local()
+
+
+def get_replica_aliases():
+    """Give aliases of read replicas from DATABASES setting."""
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def replica_reads(allowed=True):
+    """Send reads inside of the block to a replica, or to the primary database if allowed is False.
+
+    Blocks may be nested, the innermost one wins. One replica is chosen for the whole block,
+    so all reads of a request see the same state of data. May be used as decorator.
+
+    :param allowed: whether reads may go to a replica
+    :type: bool
+    """
+    replica_aliases = get_replica_aliases()
+    if not hasattr(routing_state, 'aliases'):
+        routing_state.aliases = []
+    routing_state.aliases.append(random.choice(replica_aliases) if allowed and replica_aliases else None)
+    try:
+        yield
+    finally:
+        routing_state.aliases.pop()
+
+
+def iter_with_replica_reads(iterable):
+    """Give items of iterable reading them inside of replica_reads().
+
+    Streaming responses are iterated after the view has returned, so decorator of the view
+    doesn't cover them.
+    """
+    with replica_reads():
+        yield from iterable
+
+
+def get_read_replica():
+    """Give alias of the replica which serves reads of the current thread, None for the primary database."""
+    aliases = getattr(routing_state, 'aliases', None)
+    return aliases[-1] if aliases else None
+
+
+class PrimaryReplicaRouter:
+    """Database router which sends reads inside of replica_reads() to read replicas."""
+
+    def db_for_read(self, model, **hints):
+        replica_alias = get_read_replica()
+        if replica_alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica_alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,90 @@
+"""Evolution chains of pokemon species kept in the closure table PokemonEvolutionLink."""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from pokemon_entities.images import get_image_url
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonEvolutionLink
+
+
+def get_closure(previous_evolutions):
+    """Give all pairs of species where one evolves from another.
+
+    :param previous_evolutions: dict like {pokemon_id: id of previous evolution or None}
+    :type: dict
+    :return: dict like {(ancestor_id, descendant_id): depth}, with pairs (id, id) of depth 0
+    :type: dict
+    """
+    closure = {}
+    for pokemon_id in previous_evolutions:
+        ancestor_id = pokemon_id
+        depth = 0
+        while ancestor_id is not None and (ancestor_id, pokemon_id) not in closure:
+            closure[(ancestor_id, pokemon_id)] = depth
+            ancestor_id = previous_evolutions.get(ancestor_id)
+            depth += 1
+    return closure
+
+
+@transaction.atomic
+def rebuild_evolution_links():
+    """Make the closure table equal to the current previous_evolution links.
+
+    Only changed links are deleted or created.
+    """
+    closure = get_closure(dict(Pokemon.objects.values_list('id', 'previous_evolution_id')))
+    existing_links = {
+        (ancestor_id, descendant_id): (link_id, depth)
+        for link_id, ancestor_id, descendant_id, depth in
+        PokemonEvolutionLink.objects.values_list('id', 'ancestor_id', 'descendant_id', 'depth')
+    }
+    stale_link_ids = [link_id for pair, (link_id, depth) in existing_links.items()
+                      if closure.get(pair) != depth]
+    PokemonEvolutionLink.objects.filter(id__in=stale_link_ids).delete()
+    PokemonEvolutionLink.objects.bulk_create([
+        PokemonEvolutionLink(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+        for (ancestor_id, descendant_id), depth in closure.items()
+        if existing_links.get((ancestor_id, descendant_id), (None, None))[1] != depth
+    ])
+
+
+def is_evolution_link_actual(pokemon):
+    """Check that the closure table knows the current previous evolution of pokemon.
+
+    :param pokemon: pokemon specie
+    :type: Pokemon
+    :return: True if the closure table doesn't need to be rebuilt
+    :type: bool
+    """
+    parent_ids = set(PokemonEvolutionLink.objects.filter(descendant=pokemon, depth__lte=1).values_list(
+        'ancestor_id', flat=True))
+    return parent_ids == {pokemon.id, pokemon.previous_evolution_id} - {None}
+
+
+def get_evolution_chain(pokemon):
+    """Give the whole evolution family of pokemon specie by one query.
+
+    :param pokemon: pokemon specie
+    :type: Pokemon
+    :return: stages of evolution from the first one, every stage is list of species like
+             {'pokemon_id': ..., 'img_url': ..., 'img_webp_url': ..., 'title_ru': ...,
+             'previous_evolution_id': ...}
+    :type: list
+    """
+    root_ids = PokemonEvolutionLink.objects.filter(descendant=pokemon).order_by('-depth').values('ancestor_id')[:1]
+    family = Pokemon.objects.filter(ancestor_links__ancestor_id__in=root_ids).annotate(
+        stage=F('ancestor_links__depth')).order_by('stage', 'id')
+
+    stages = defaultdict(list)
+    for specie in family:
+        stages[specie.stage].append({
+            'pokemon_id': specie.id,
+            'img_url': get_image_url(specie, 'icon'),
+            'img_webp_url': get_image_url(specie, 'icon', 'webp'),
+            'title_ru': specie.title,
+            'previous_evolution_id': specie.previous_evolution_id,
+        })
+    return [stages[stage] for stage in sorted(stages)]
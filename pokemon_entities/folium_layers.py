@@ -0,0 +1,322 @@
+import json
+
+from branca.element import MacroElement, Template
+
+
+ENTITY_MARKERS_JS = u"""
+function pokemonEntityPopup(props) {
+    if (!props.level) {
+        return 'Нет данных';
+    }
+    return '<table><tr><td>Ур:</td><td>' + props.level + '</td></tr>' +
+        '<tr><td>Зд:</td><td>' + props.health + '</td></tr>' +
+        '<tr><td>Сил:</td><td>' + props.strength + '</td></tr>' +
+        '<tr><td>Защ:</td><td>' + props.defence + '</td></tr>' +
+        '<tr><td>Вын:</td><td>' + props.stamina + '</td></tr></table>';
+}
+
+function pokemonSpecieImage(specie) {
+    if (specie.sprite_url) {
+        return '<div style="width:50px;height:50px;background:url(' + specie.sprite_url + ') -' +
+            specie.sprite_position[0] + 'px -' + specie.sprite_position[1] + 'px;"></div>';
+    }
+    return '<img src="' + specie.image_url + '" style="width:50px;height:50px;">';
+}
+
+function pokemonSpeciesIcons(species) {
+    var icons = {};
+    return function(pokemonId) {
+        if (!icons[pokemonId]) {
+            var specie = species[pokemonId];
+            icons[pokemonId] = specie.sprite_url ?
+                L.divIcon({className: '', iconSize: [50, 50], html: pokemonSpecieImage(specie)}) :
+                L.icon({iconUrl: specie.image_url, iconSize: [50, 50]});
+        }
+        return icons[pokemonId];
+    };
+}
+
+function pokemonClusterMarker(map, latlng, count, specie) {
+    var icon = L.divIcon({
+        className: '',
+        iconSize: [50, 50],
+        html: '<div style="position:relative;width:50px;height:50px;opacity:0.8;">' + pokemonSpecieImage(specie) +
+            '<span style="position:absolute;right:0;bottom:0;padding:0 4px;border-radius:8px;' +
+            'background:#0275d8;color:#fff;font-size:12px;">' + count + '</span></div>'
+    });
+    return L.marker(latlng, {icon: icon}).bindTooltip(specie.title + ' и др.: ' + count).on('click', function() {
+        map.setView(latlng, map.getZoom() + 2);
+    });
+}
+"""
+
+ENTITY_FIELDS = ['id', 'latitude', 'longitude', 'pokemon_id', 'level', 'health', 'strength', 'defence', 'stamina']
+
+
+def to_js(value):
+    """Serialize value to JSON which is safe to put inside of <script> tag.
+
+    :param value: any JSON-serializable value
+    :return: JavaScript literal
+    :type: string
+    """
+    return json.dumps(value, ensure_ascii=False).replace('</', '<\\/')
+
+
+class ApiEntitiesLayer(MacroElement):
+    """Map layer which loads active pokemon entities from the entities API.
+
+    The layer asks the API only about entities inside of the visible part of the map
+    and reloads them every time when user moves or zooms the map, so the page itself
+    doesn't contain any markers. Clusters given by the API are drawn as icon of the most
+    common specie with number of entities.
+
+    If stream_url is given, the layer also listens to live updates of the visible part of
+    the map: from cluster_max_zoom markers are added and removed by events of the stream
+    without requests to the API, on lower zoom levels clusters are reloaded from the API
+    when the stream reports any change.
+
+    :param url: absolute URL of the entities API
+    :type: string
+    :param pokemon_id: id of pokemon specie to show, all species if None
+    :type: int
+    :param stream_url: absolute URL of the stream of live updates
+    :type: string
+    :param cluster_max_zoom: zoom level from which the API gives entities without clusters
+    :type: int
+    """
+
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var options = {{ this.options }};
+            var layer = L.layerGroup().addTo(map);
+            """ + ENTITY_MARKERS_JS + u"""
+            var species = {};
+            var speciesIcon = pokemonSpeciesIcons(species);
+            var request = null;
+            var stream = null;
+            var markers = {};
+            var reloadTimeout = null;
+            function getQuery() {
+                var bounds = map.getBounds();
+                var bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()];
+                var query = 'bbox=' + bbox.map(function(value) { return value.toFixed(6); }).join(',') +
+                    '&zoom=' + map.getZoom();
+                if (options.pokemon_id) {
+                    query += '&pokemon_id=' + options.pokemon_id;
+                }
+                return query;
+            }
+            function addSpecies(collectionSpecies) {
+                Object.keys(collectionSpecies).forEach(function(pokemonId) {
+                    species[pokemonId] = collectionSpecies[pokemonId];
+                });
+            }
+            function addMarker(entityId, latlng, props) {
+                if (markers[entityId]) {
+                    layer.removeLayer(markers[entityId]);
+                }
+                markers[entityId] = L.marker(latlng, {icon: speciesIcon(props.pokemon_id)})
+                    .bindTooltip(species[props.pokemon_id].title)
+                    .bindPopup(pokemonEntityPopup(props))
+                    .addTo(layer);
+            }
+            function clearMarkers() {
+                layer.clearLayers();
+                markers = {};
+            }
+            function isStreamed() {
+                return options.stream_url && window.EventSource && map.getZoom() >= options.cluster_max_zoom;
+            }
+            function loadEntities() {
+                if (request) {
+                    request.abort();
+                    request = null;
+                }
+                if (isStreamed()) {
+                    return;
+                }
+                var current = request = new XMLHttpRequest();
+                current.open('GET', options.url + '?' + getQuery());
+                current.onload = function() {
+                    if (current !== request || current.status !== 200) {
+                        return;
+                    }
+                    var collection = JSON.parse(current.responseText);
+                    addSpecies(collection.species);
+                    clearMarkers();
+                    collection.features.forEach(function(feature) {
+                        var coordinates = feature.geometry.coordinates;
+                        var latlng = [coordinates[1], coordinates[0]];
+                        var pokemonId = feature.properties.pokemon_id;
+                        if (feature.properties.cluster) {
+                            pokemonClusterMarker(map, latlng, feature.properties.count, species[pokemonId])
+                                .addTo(layer);
+                            return;
+                        }
+                        addMarker(feature.id, latlng, feature.properties);
+                    });
+                };
+                current.send();
+            }
+            function scheduleReload() {
+                if (!reloadTimeout) {
+                    reloadTimeout = setTimeout(function() {
+                        reloadTimeout = null;
+                        loadEntities();
+                    }, 1000);
+                }
+            }
+            function onRows(event, replace) {
+                var data = JSON.parse(event.data);
+                addSpecies(data.species);
+                if (!isStreamed()) {
+                    if (!replace) {
+                        scheduleReload();
+                    }
+                    return;
+                }
+                if (replace) {
+                    clearMarkers();
+                }
+                data.rows.forEach(function(row) {
+                    var props = {};
+                    options.fields.forEach(function(field, index) {
+                        props[field] = row[index];
+                    });
+                    addMarker(props.id, [props.latitude, props.longitude], props);
+                });
+            }
+            function openStream() {
+                if (stream) {
+                    stream.close();
+                }
+                stream = new EventSource(options.stream_url + '?' + getQuery());
+                stream.addEventListener('snapshot', function(event) { onRows(event, true); });
+                stream.addEventListener('appear', function(event) { onRows(event, false); });
+                stream.addEventListener('disappear', function(event) {
+                    if (!isStreamed()) {
+                        scheduleReload();
+                        return;
+                    }
+                    JSON.parse(event.data).ids.forEach(function(entityId) {
+                        if (markers[entityId]) {
+                            layer.removeLayer(markers[entityId]);
+                            delete markers[entityId];
+                        }
+                    });
+                });
+            }
+            function update() {
+                loadEntities();
+                if (options.stream_url && window.EventSource) {
+                    openStream();
+                }
+            }
+            map.on('moveend', update);
+            update();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, url, pokemon_id=None, stream_url=None, cluster_max_zoom=0):
+        super(ApiEntitiesLayer, self).__init__()
+        self._name = 'ApiEntitiesLayer'
+        self.options = to_js({
+            'url': url,
+            'pokemon_id': pokemon_id,
+            'stream_url': stream_url,
+            'cluster_max_zoom': cluster_max_zoom,
+            'fields': ENTITY_FIELDS,
+        })
+
+
+class SpeciesMarkersLayer(MacroElement):
+    """Map layer with markers of pokemon entities.
+
+    Icon of every pokemon specie (or its position in the sprite sheet) is put on the page and
+    created once, markers refer to icons by pokemon id, and entities are passed as compact rows
+    of ENTITY_FIELDS values. So size of the page grows with number of species rather than with
+    number of entities.
+
+    If clusters are given, on zoom levels lower than cluster_max_zoom the layer shows clusters
+    of that zoom level (or of the nearest one) instead of separate markers, and creates markers
+    of entities only when they are shown.
+
+    :param species: info about species by pokemon id, dict like {'title': ..., 'image_url': ...,
+                    'sprite_url': ..., 'sprite_position': [x, y]}
+    :type: dict
+    :param entities: rows of values of ENTITY_FIELDS
+    :type: list
+    :param clusters: clusters by zoom level, dict like {'clusters': [[lat, lon, count, pokemon_id], ...],
+                     'entities': [ids of entities which are shown separately]}
+    :type: dict
+    :param cluster_max_zoom: zoom level from which all entities are shown separately
+    :type: int
+    """
+
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var species = {{ this.species }};
+            var fields = {{ this.fields }};
+            var entities = {{ this.entities }};
+            var clusters = {{ this.clusters }};
+            var clusterMaxZoom = {{ this.cluster_max_zoom }};
+            var layer = L.layerGroup().addTo(map);
+            """ + ENTITY_MARKERS_JS + u"""
+            var speciesIcon = pokemonSpeciesIcons(species);
+            var clusterZooms = Object.keys(clusters).map(Number).sort(function(a, b) { return a - b; });
+            var entitiesById = {};
+            var markers = {};
+            entities.forEach(function(row) {
+                var props = {};
+                fields.forEach(function(field, index) {
+                    props[field] = row[index];
+                });
+                entitiesById[props.id] = props;
+            });
+            function entityMarker(entityId) {
+                if (!markers[entityId]) {
+                    var props = entitiesById[entityId];
+                    markers[entityId] = L.marker([props.latitude, props.longitude], {icon: speciesIcon(props.pokemon_id)})
+                        .bindTooltip(species[props.pokemon_id].title)
+                        .bindPopup(pokemonEntityPopup(props));
+                }
+                return markers[entityId];
+            }
+            function drawMarkers() {
+                var zoom = map.getZoom();
+                layer.clearLayers();
+                if (zoom >= clusterMaxZoom || !clusterZooms.length) {
+                    Object.keys(entitiesById).forEach(function(entityId) {
+                        entityMarker(entityId).addTo(layer);
+                    });
+                    return;
+                }
+                var clusterZoom = Math.min(Math.max(zoom, clusterZooms[0]), clusterZooms[clusterZooms.length - 1]);
+                var zoomClusters = clusters[clusterZoom];
+                zoomClusters.clusters.forEach(function(cluster) {
+                    pokemonClusterMarker(map, [cluster[0], cluster[1]], cluster[2], species[cluster[3]]).addTo(layer);
+                });
+                zoomClusters.entities.forEach(function(entityId) {
+                    entityMarker(entityId).addTo(layer);
+                });
+            }
+            map.on('zoomend', drawMarkers);
+            drawMarkers();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, species, entities, clusters=None, cluster_max_zoom=0):
+        super(SpeciesMarkersLayer, self).__init__()
+        self._name = 'SpeciesMarkersLayer'
+        self.species = to_js(species)
+        self.fields = to_js(ENTITY_FIELDS)
+        self.entities = to_js(entities)
+        self.clusters = to_js(clusters or {})
+        self.cluster_max_zoom = to_js(cluster_max_zoom)
@@ -0,0 +1,153 @@
+"""Geometry helpers for locating pokemon entities on the map.
+
+Coordinates of entities are indexed by tile key: the Z-order (Morton) code of Web Mercator
+tile of zoom TILE_KEY_ZOOM which contains the point. Every tile of lower zoom covers one
+continuous range of tile keys, so any bounding box may be covered by several key ranges
+which are looked up with an ordinary B-tree index.
+"""
+
+import math
+
+
+TILE_KEY_ZOOM = 16
+MAX_LATITUDE = 85.0511287798
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def latlon_to_tile(lat, lon, zoom):
+    """Give Web Mercator tile coordinates of the point.
+
+    :param lat: latitude of the point
+    :type: float
+    :param lon: longitude of the point
+    :type: float
+    :param zoom: zoom level of the tile
+    :type: int
+    :return: tuple (x, y) of tile coordinates
+    :type: tuple
+    """
+    tiles_count = 1 << zoom
+    lat = min(max(lat, -MAX_LATITUDE), MAX_LATITUDE)
+    lat_rad = math.radians(lat)
+    x = (lon + 180.0) / 360.0 * tiles_count
+    y = (1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * tiles_count
+    return (min(max(int(x), 0), tiles_count - 1),
+            min(max(int(y), 0), tiles_count - 1))
+
+
+def tile_to_latlon(x, y, zoom):
+    """Give coordinates of north-west corner of Web Mercator tile.
+
+    :param x: x coordinate of the tile
+    :type: int
+    :param y: y coordinate of the tile
+    :type: int
+    :param zoom: zoom level of the tile
+    :type: int
+    :return: tuple (lat, lon) of the corner
+    :type: tuple
+    """
+    tiles_count = 1 << zoom
+    lon = x / tiles_count * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / tiles_count))))
+    return lat, lon
+
+
+def interleave_bits(x, y):
+    """Give Morton code of tile coordinates (bits of x and y are interleaved)."""
+    code = 0
+    for bit in range(TILE_KEY_ZOOM):
+        code |= ((x >> bit) & 1) << (2 * bit)
+        code |= ((y >> bit) & 1) << (2 * bit + 1)
+    return code
+
+
+def get_tile_key(lat, lon):
+    """Give tile key of the point.
+
+    :param lat: latitude of the point
+    :type: float
+    :param lon: longitude of the point
+    :type: float
+    :return: Morton code of the tile of zoom TILE_KEY_ZOOM containing the point
+    :type: int
+    """
+    return interleave_bits(*latlon_to_tile(lat, lon, TILE_KEY_ZOOM))
+
+
+def get_tile_key_range(x, y, zoom):
+    """Give range of tile keys of points inside of tile of zoom not greater than TILE_KEY_ZOOM.
+
+    :param x: x coordinate of the tile
+    :type: int
+    :param y: y coordinate of the tile
+    :type: int
+    :param zoom: zoom level of the tile
+    :type: int
+    :return: tuple (start, stop), stop is not included
+    :type: tuple
+    """
+    shift = 2 * (TILE_KEY_ZOOM - zoom)
+    start = interleave_bits(x, y) << shift
+    return start, start + (1 << shift)
+
+
+def get_tile_key_ranges(min_lon, min_lat, max_lon, max_lat, max_tiles=16):
+    """Give ranges of tile keys which cover the bounding box.
+
+    The function chooses the deepest zoom in which the bounding box is covered by not more
+    than max_tiles tiles, and turns every tile into the range of tile keys. Adjacent ranges
+    are merged. Bounding box must not cross the antimeridian.
+
+    :param min_lon: west border of the bounding box
+    :type: float
+    :param min_lat: south border of the bounding box
+    :type: float
+    :param max_lon: east border of the bounding box
+    :type: float
+    :param max_lat: north border of the bounding box
+    :type: float
+    :param max_tiles: max number of tiles covering the bounding box
+    :type: int
+    :return: list of tuples (start, stop) of tile keys, stop is not included
+    :type: list
+    """
+    for zoom in range(TILE_KEY_ZOOM, -1, -1):
+        min_x, min_y = latlon_to_tile(max_lat, min_lon, zoom)
+        max_x, max_y = latlon_to_tile(min_lat, max_lon, zoom)
+        if (max_x - min_x + 1) * (max_y - min_y + 1) <= max_tiles:
+            break
+
+    shift = 2 * (TILE_KEY_ZOOM - zoom)
+    starts = sorted(
+        interleave_bits(x, y) << shift
+        for x in range(min_x, max_x + 1)
+        for y in range(min_y, max_y + 1)
+    )
+    ranges = []
+    for start in starts:
+        stop = start + (1 << shift)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], stop)
+        else:
+            ranges.append((start, stop))
+    return ranges
+
+
+def get_radius_bbox(lat, lon, radius_m):
+    """Give bounding box which contains the circle.
+
+    :param lat: latitude of center of the circle
+    :type: float
+    :param lon: longitude of center of the circle
+    :type: float
+    :param radius_m: radius of the circle in meters
+    :type: float
+    :return: tuple (min_lon, min_lat, max_lon, max_lat)
+    :type: tuple
+    """
+    delta_lat = radius_m / METERS_PER_DEGREE
+    delta_lon = delta_lat / max(math.cos(math.radians(lat)), 1e-6)
+    return (max(lon - delta_lon, -180.0), max(lat - delta_lat, -90.0),
+            min(lon + delta_lon, 180.0), min(lat + delta_lat, 90.0))
@@ -0,0 +1,153 @@
+"""Heatmaps of spawns of pokemon species.
+
+Spawns are counted in the rollup table PokemonSpawnRollup by (specie, cell, hour), so a heatmap
+for any time range is made of rollup rows and raw pokemon entities are not scanned. Rows are
+updated incrementally: by signals on save and delete of a pokemon entity (see signals.py) and
+by add_entities_to_rollup() after bulk_create() of entities.
+
+A cell is a Web Mercator tile of zoom HEATMAP_CELL_ZOOM, i.e. tile_key of entity without
+the lowest bits, so cells of entities are taken from the indexed tile keys.
+"""
+
+from collections import Counter
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from pokemon_entities import geo
+from pokemon_entities.models import PokemonSpawnRollup
+
+
+HEATMAP_CELL_ZOOM = 15
+HEATMAP_CELL_SHIFT = 2 * (geo.TILE_KEY_ZOOM - HEATMAP_CELL_ZOOM)
+
+
+def get_hour(moment):
+    """Give the beginning of UTC hour of the moment."""
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def get_rollup_key(pokemon_id, tile_key, appear_at):
+    """Give key of rollup row counting the spawn, None if the spawn has no appear_at.
+
+    :param pokemon_id: id of pokemon specie
+    :type: int
+    :param tile_key: tile key of the spawn
+    :type: int
+    :param appear_at: moment when the spawn appears
+    :type: datetime
+    :return: tuple (pokemon_id, cell, hour)
+    :type: tuple
+    """
+    if appear_at is None:
+        return None
+    return pokemon_id, tile_key >> HEATMAP_CELL_SHIFT, get_hour(appear_at)
+
+
+def count_spawns(spawns):
+    """Count spawns by rollup keys.
+
+    :param spawns: tuples (pokemon_id, tile_key, appear_at)
+    :type: iterable
+    :return: Counter like {(pokemon_id, cell, hour): count}
+    :type: Counter
+    """
+    counts = Counter(get_rollup_key(*spawn) for spawn in spawns)
+    counts.pop(None, None)
+    return counts
+
+
+@transaction.atomic
+def add_to_rollup(deltas):
+    """Add deltas to counts of the rollup table, rows with zero count are deleted.
+
+    Existing rows are locked and read with one query, changed with one bulk_update(),
+    and missing rows are inserted with one bulk_create().
+
+    :param deltas: Counter like {(pokemon_id, cell, hour): delta}
+    :type: Counter
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    pokemon_ids, cells, hours = (set(values) for values in zip(*deltas))
+    existing_rows = PokemonSpawnRollup.objects.select_for_update().filter(
+        pokemon_id__in=pokemon_ids, cell__in=cells, hour__in=hours)
+
+    changed_rows = []
+    empty_row_ids = []
+    for row in existing_rows:
+        key = (row.pokemon_id, row.cell, row.hour)
+        if key not in deltas:
+            continue
+        row.count += deltas.pop(key)
+        if row.count > 0:
+            changed_rows.append(row)
+        else:
+            empty_row_ids.append(row.id)
+
+    PokemonSpawnRollup.objects.bulk_update(changed_rows, ['count'])
+    PokemonSpawnRollup.objects.filter(id__in=empty_row_ids).delete()
+    PokemonSpawnRollup.objects.bulk_create([
+        PokemonSpawnRollup(pokemon_id=pokemon_id, cell=cell, hour=hour, count=delta)
+        for (pokemon_id, cell, hour), delta in deltas.items()
+        if delta > 0
+    ])
+
+
+def add_entities_to_rollup(pokemon_entities):
+    """Count new pokemon entities, e.g. created by bulk_create(), in the rollup table.
+
+    :param pokemon_entities: pokemon entities with tile_key
+    :type: list
+    """
+    add_to_rollup(count_spawns(
+        (entity.pokemon_id, entity.tile_key, entity.appear_at) for entity in pokemon_entities))
+
+
+def decode_cells(cells):
+    """Give coordinates of centers of cells.
+
+    :param cells: cells as Morton codes of tiles of zoom HEATMAP_CELL_ZOOM
+    :type: ndarray
+    :return: tuple (latitudes, longitudes)
+    :type: tuple
+    """
+    x = np.zeros(len(cells), dtype=np.int64)
+    y = np.zeros(len(cells), dtype=np.int64)
+    for bit in range(HEATMAP_CELL_ZOOM):
+        x |= ((cells >> (2 * bit)) & 1) << bit
+        y |= ((cells >> (2 * bit + 1)) & 1) << bit
+    tiles_count = 1 << HEATMAP_CELL_ZOOM
+    longitudes = (x + 0.5) / tiles_count * 360.0 - 180.0
+    latitudes = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 0.5) / tiles_count))))
+    return latitudes, longitudes
+
+
+def get_heatmap(start, end, pokemon_id=None):
+    """Give number of spawns by cells for the time range.
+
+    Rollup rows are loaded as two columns and summed by cells with NumPy.
+
+    :param start: beginning of the time range, the whole hour of start is included
+    :type: datetime
+    :param end: end of the time range, hours which begin before it are included
+    :type: datetime
+    :param pokemon_id: id of pokemon specie, all species if None
+    :type: int
+    :return: list of [latitude, longitude, count] of centers of cells
+    :type: list
+    """
+    rows = PokemonSpawnRollup.objects.filter(hour__gte=get_hour(start), hour__lt=end)
+    if pokemon_id is not None:
+        rows = rows.filter(pokemon_id=pokemon_id)
+    rows = list(rows.order_by().values_list('cell', 'count'))
+    if not rows:
+        return []
+
+    cells, counts = np.array(rows, dtype=np.int64).T
+    unique_cells, cell_indexes = np.unique(cells, return_inverse=True)
+    cell_counts = np.bincount(cell_indexes, weights=counts).astype(np.int64)
+    latitudes, longitudes = decode_cells(unique_cells)
+    return np.column_stack([latitudes, longitudes, cell_counts]).tolist()
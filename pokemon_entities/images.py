@@ -0,0 +1,120 @@
+"""Derivatives of pokemon and element images.
+
+When image is uploaded, it is resized to every size of DERIVATIVE_SIZES and saved as PNG and,
+if Pillow supports it, as WebP next to the original in folder derivatives. Names of derivatives
+contain hash of the original content, so they never change and may be cached forever.
+"""
+
+import hashlib
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import features
+from PIL import Image
+
+
+DERIVATIVES_DIR = 'derivatives'
+DERIVATIVE_SIZES = {
+    'icon': (50, 50),
+    'element': (20, 20),
+    'card': (200, 200),
+}
+IMAGE_HASH_LENGTH = 12
+
+
+def get_image_formats():
+    return ['png', 'webp'] if features.check('webp') else ['png']
+
+
+def get_image_hash(image_field):
+    """Give hash of content of the image.
+
+    :param image_field: image of pokemon or element type
+    :type: ImageFieldFile
+    :return: hex hash of image content, empty string if there is no image
+    :type: string
+    """
+    if not image_field:
+        return ''
+    hasher = hashlib.sha1()
+    with image_field.storage.open(image_field.name, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(64 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()[:IMAGE_HASH_LENGTH]
+
+
+def get_derivative_name(image_field, image_hash, size, image_format):
+    stem = os.path.splitext(os.path.basename(image_field.name))[0]
+    width, height = DERIVATIVE_SIZES[size]
+    return '{dir}/{stem}.{hash}.{width}x{height}.{format}'.format(
+        dir=DERIVATIVES_DIR, stem=stem, hash=image_hash, width=width, height=height, format=image_format)
+
+
+def make_derivatives(image_field, image_hash):
+    """Save derivatives of the image of all sizes and formats which don't exist yet.
+
+    :param image_field: image of pokemon or element type
+    :type: ImageFieldFile
+    :param image_hash: hash of image content
+    :type: string
+    """
+    storage = image_field.storage
+    with storage.open(image_field.name, 'rb') as image_file:
+        original = Image.open(image_file)
+        original.load()
+    original = original.convert('RGBA')
+
+    for size in DERIVATIVE_SIZES:
+        image = None
+        for image_format in get_image_formats():
+            name = get_derivative_name(image_field, image_hash, size, image_format)
+            if storage.exists(name):
+                continue
+            if image is None:
+                image = original.copy()
+                image.thumbnail(DERIVATIVE_SIZES[size], Image.LANCZOS)
+            content = io.BytesIO()
+            image.save(content, format=image_format.upper(), optimize=True)
+            storage.save(name, ContentFile(content.getvalue()))
+
+
+def update_derivatives(instance):
+    """Make derivatives of image of pokemon or element type if the image has changed.
+
+    :param instance: pokemon or element type
+    :type: Pokemon or PokemonElementType
+    :return: True if image_hash of instance has changed
+    :type: bool
+    """
+    image_hash = get_image_hash(instance.image)
+    if image_hash == instance.image_hash:
+        return False
+    if image_hash:
+        make_derivatives(instance.image, image_hash)
+    instance.image_hash = image_hash
+    # update() doesn't set auto_now fields, and the species catalogue is versioned by updated_at
+    type(instance).objects.filter(id=instance.id).update(image_hash=image_hash, updated_at=timezone.now())
+    return True
+
+
+def get_image_url(instance, size, image_format='png'):
+    """Give URL of derivative of image, or of the original if derivatives are not made.
+
+    :param instance: pokemon or element type
+    :type: Pokemon or PokemonElementType
+    :param size: name of size from DERIVATIVE_SIZES
+    :type: string
+    :param image_format: png or webp
+    :type: string
+    :return: URL of image, None if there is no image or no derivative of this format
+    :type: string
+    """
+    if not instance.image:
+        return None
+    if not instance.image_hash:
+        return instance.image.url if image_format == 'png' else None
+    if image_format not in get_image_formats():
+        return None
+    return instance.image.storage.url(get_derivative_name(instance.image, instance.image_hash, size, image_format))
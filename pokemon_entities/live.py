@@ -0,0 +1,120 @@
+"""Live updates of pokemon entities for open map pages.
+
+The map page opens an EventSource (Server-Sent Events) stream for the visible part of the map.
+The stream starts with a snapshot of active entities and then sends only deltas: entities which
+have appeared or changed and ids of entities which have disappeared. The stream doesn't query
+database by itself: entities are taken from the spawn snapshot of the process (see snapshot.py)
+and selected again only when rows of the snapshot have changed or when the nearest appear_at or
+disappear_at has come.
+
+The project is served by WSGI, so every stream holds a worker thread. Streams are closed after
+LIVE_STREAM_DURATION and browser reconnects by itself in LIVE_RETRY_MS.
+"""
+
+import json
+import time
+
+from django.utils import timezone
+
+from pokemon_entities.folium_layers import ENTITY_FIELDS
+from pokemon_entities.snapshot import get_entity_values
+from pokemon_entities.snapshot import get_spawn_snapshot
+
+
+LIVE_POLL_INTERVAL = 2
+LIVE_HEARTBEAT_INTERVAL = 15
+LIVE_STREAM_DURATION = 5 * 60
+LIVE_RETRY_MS = 3000
+
+
+def format_event(event, data):
+    """Give Server-Sent Event as text.
+
+    :param event: type of the event
+    :type: string
+    :param data: JSON-serializable data of the event
+    :return: text of the event
+    :type: string
+    """
+    return 'event: {0}\ndata: {1}\n\n'.format(event, json.dumps(data, ensure_ascii=False))
+
+
+def get_entity_rows(snapshot, now, bbox, pokemon_id, max_entities):
+    """Give rows of active pokemon entities by their ids.
+
+    :param snapshot: spawn snapshot
+    :type: SpawnSnapshot
+    :param now: current time
+    :type: datetime
+    :param bbox: region of the stream, tuple (min_lon, min_lat, max_lon, max_lat)
+    :type: tuple
+    :param pokemon_id: id of pokemon specie, all species if None
+    :type: int
+    :param max_entities: max number of entities to give
+    :type: int
+    :return: dict like {id: row of ENTITY_FIELDS values}
+    :type: dict
+    """
+    rows = get_entity_values(snapshot.select(now, bbox, pokemon_id)[:max_entities])
+    return {row[0]: row for row in rows}
+
+
+def iter_spawn_events(bbox, pokemon_id, get_species, max_entities, sleep=time.sleep):
+    """Give Server-Sent Events with changes of active pokemon entities.
+
+    Events are: snapshot (all active entities), appear (new or changed entities),
+    disappear (ids of entities) and comment lines as heartbeat. Entities are sent as
+    {'rows': [...], 'species': {...}}, rows are lists of ENTITY_FIELDS values.
+
+    :param bbox: region of the stream, tuple (min_lon, min_lat, max_lon, max_lat)
+    :type: tuple
+    :param pokemon_id: id of pokemon specie, all species if None
+    :type: int
+    :param get_species: function which gives info about species by set of pokemon ids
+    :type: function
+    :param max_entities: max number of entities in the stream
+    :type: int
+    :param sleep: function which waits for number of seconds
+    :type: function
+    :return: generator of texts of events
+    :type: generator
+    """
+    def make_rows_data(rows):
+        return {
+            'rows': rows,
+            'species': get_species({row[ENTITY_FIELDS.index('pokemon_id')] for row in rows}),
+        }
+
+    yield 'retry: {0}\n\n'.format(LIVE_RETRY_MS)
+
+    started_at = time.monotonic()
+    now = timezone.now()
+    snapshot = get_spawn_snapshot()
+    rows_by_id = get_entity_rows(snapshot, now, bbox, pokemon_id, max_entities)
+    next_boundary = snapshot.get_next_boundary(now, bbox, pokemon_id)
+    last_sent_at = time.monotonic()
+    yield format_event('snapshot', make_rows_data(list(rows_by_id.values())))
+
+    while time.monotonic() - started_at < LIVE_STREAM_DURATION:
+        sleep(LIVE_POLL_INTERVAL)
+        now = timezone.now()
+        current_snapshot = get_spawn_snapshot()
+        if current_snapshot.rows is snapshot.rows and (next_boundary is None or next_boundary > now):
+            if time.monotonic() - last_sent_at >= LIVE_HEARTBEAT_INTERVAL:
+                last_sent_at = time.monotonic()
+                yield ': heartbeat\n\n'
+            continue
+
+        snapshot = current_snapshot
+        current_rows_by_id = get_entity_rows(snapshot, now, bbox, pokemon_id, max_entities)
+        next_boundary = snapshot.get_next_boundary(now, bbox, pokemon_id)
+
+        appeared = [row for entity_id, row in current_rows_by_id.items() if rows_by_id.get(entity_id) != row]
+        disappeared = [entity_id for entity_id in rows_by_id if entity_id not in current_rows_by_id]
+        rows_by_id = current_rows_by_id
+        if appeared:
+            last_sent_at = time.monotonic()
+            yield format_event('appear', make_rows_data(appeared))
+        if disappeared:
+            last_sent_at = time.monotonic()
+            yield format_event('disappear', {'ids': disappeared})
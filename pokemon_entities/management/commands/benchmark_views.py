@@ -0,0 +1,149 @@
+import json
+import subprocess
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from pokemon_entities import geo
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonEntity
+from pokemon_entities.views import MOSCOW_CENTER
+
+
+VIEWPORT_DEGREES = 0.05
+STREAM_FIRST_EVENT = b'event: snapshot'
+
+
+def get_percentile(values, percentile):
+    ordered_values = sorted(values)
+    index = min(int(round(percentile / 100 * (len(ordered_values) - 1))), len(ordered_values) - 1)
+    return ordered_values[index]
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = '''Measure views through Django test client.
+
+    For every endpoint the command reports p50 and p95 latency, number of SQL queries to all
+    databases (replicas too) and size of response, and peak memory of one more request traced
+    by tracemalloc. The stream of entities is read until its first snapshot of entities. Results
+    may be saved as JSON to compare commits. Fill DB with seed_synthetic first.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help='number of measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=2, help='number of requests before measuring')
+        parser.add_argument('--species', type=int, default=3, help='number of species pages to measure')
+        parser.add_argument('--cold', action='store_true', help='clear cache before every request')
+        parser.add_argument('--output', help='path to JSON file with results')
+
+    def get_endpoints(self, species_count):
+        lat, lon = MOSCOW_CENTER
+        pokemon_ids = list(Pokemon.objects.order_by('id').values_list('id', flat=True)[:species_count])
+        endpoints = [('mainpage', reverse('mainpage'))]
+        for pokemon_id in pokemon_ids:
+            endpoints.append(('pokemon {0}'.format(pokemon_id), reverse('pokemon', args=[pokemon_id])))
+        for zoom, half_size in [(12, VIEWPORT_DEGREES * 4), (16, VIEWPORT_DEGREES / 4)]:
+            bbox = '{0},{1},{2},{3}'.format(lon - half_size, lat - half_size, lon + half_size, lat + half_size)
+            endpoints.append(('api entities z{0}'.format(zoom),
+                              '{0}?bbox={1}&zoom={2}'.format(reverse('api_entities'), bbox, zoom)))
+            x, y = geo.latlon_to_tile(lat, lon, zoom)
+            endpoints.append(('tile z{0}'.format(zoom), reverse('tile', args=[zoom, x, y])))
+        bbox = '{0},{1},{2},{3}'.format(lon - VIEWPORT_DEGREES, lat - VIEWPORT_DEGREES,
+                                        lon + VIEWPORT_DEGREES, lat + VIEWPORT_DEGREES)
+        endpoints.append(('api entities stream', '{0}?bbox={1}'.format(reverse('api_entities_stream'), bbox)))
+        endpoints.append(('api nearest', '{0}?lat={1}&lon={2}&count=10'.format(
+            reverse('api_nearest_entities'), lat, lon)))
+        endpoints.append(('api heatmap', reverse('api_heatmap')))
+        for pokemon_id in pokemon_ids[:1]:
+            endpoints.append(('api heatmap {0}'.format(pokemon_id),
+                              '{0}?pokemon_id={1}'.format(reverse('api_heatmap'), pokemon_id)))
+            endpoints.append(('api counters {0}'.format(pokemon_id),
+                              reverse('api_pokemon_counters', args=[pokemon_id])))
+        return endpoints
+
+    def measure(self, client, url, options):
+        """Request the URL, streams are read until their first snapshot of entities.
+
+        :return: tuple (latency, number of SQL queries to all databases, response, size of content)
+        :type: tuple
+        """
+        if options['cold']:
+            cache.clear()
+        with ExitStack() as stack:
+            captured_queries = [stack.enter_context(CaptureQueriesContext(connections[alias]))
+                                for alias in connections]
+            started_at = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                content = b''
+                for chunk in response.streaming_content:
+                    content += chunk
+                    if STREAM_FIRST_EVENT in content:
+                        break
+                response.close()
+            else:
+                content = response.content
+            latency = time.perf_counter() - started_at
+        return latency, sum(len(queries) for queries in captured_queries), response, len(content)
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('Number of requests must be positive')
+        client = Client()
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['*']):
+            for name, url in self.get_endpoints(options['species']):
+                for _ in range(options['warmup']):
+                    self.measure(client, url, options)
+                latencies = []
+                queries_counts = []
+                for _ in range(options['requests']):
+                    latency, queries_count, response, content_size = self.measure(client, url, options)
+                    latencies.append(latency)
+                    queries_counts.append(queries_count)
+
+                tracemalloc.start()
+                self.measure(client, url, options)
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                results[name] = {
+                    'url': url,
+                    'status': response.status_code,
+                    'p50_ms': round(get_percentile(latencies, 50) * 1000, 2),
+                    'p95_ms': round(get_percentile(latencies, 95) * 1000, 2),
+                    'queries': max(queries_counts),
+                    'bytes': content_size,
+                    'peak_memory_kb': round(peak_memory / 1024, 1),
+                }
+                self.stdout.write('{0}: p50 {p50_ms} ms, p95 {p95_ms} ms, {queries} queries, '
+                                  '{bytes} bytes, peak memory {peak_memory_kb} KB'.format(name, **results[name]))
+
+        if options['output']:
+            report = {
+                'commit': get_commit(),
+                'created_at': timezone.now().isoformat(),
+                'entities': PokemonEntity.objects.count(),
+                'active_entities': PokemonEntity.objects.active().count(),
+                'cold': options['cold'],
+                'requests': options['requests'],
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as output_file:
+                json.dump(report, output_file, ensure_ascii=False, indent=2)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from pokemon_entities.catalogue import invalidate_species_catalogue
+from pokemon_entities.images import update_derivatives
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonElementType
+from pokemon_entities.sprites import build_sprite_sheet
+
+
+class Command(BaseCommand):
+    help = 'Make missing derivatives of images of all pokemon species and element types, and the sprite sheet.'
+
+    def handle(self, *args, **options):
+        updated_count = 0
+        for model in [Pokemon, PokemonElementType]:
+            for instance in model.objects.exclude(image='').exclude(image=None).order_by('id'):
+                if update_derivatives(instance):
+                    updated_count += 1
+        sprite_manifest = build_sprite_sheet()
+        invalidate_species_catalogue()
+        self.stdout.write('Derivatives are updated for {0} images'.format(updated_count))
+        if sprite_manifest:
+            self.stdout.write('Sprite sheet {0} contains {1} icons'.format(
+                sprite_manifest['url'], len(sprite_manifest['positions'])))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from pokemon_entities.catalogue import invalidate_species_catalogue
+from pokemon_entities.sprites import build_sprite_sheet
+
+
+class Command(BaseCommand):
+    help = 'Pack icons of all pokemon species into the sprite sheet with JSON manifest and CSS.'
+
+    def handle(self, *args, **options):
+        sprite_manifest = build_sprite_sheet()
+        invalidate_species_catalogue()
+        if sprite_manifest is None:
+            self.stdout.write('No specie has image, sprite sheet is not built')
+            return
+        self.stdout.write('Sprite sheet {0} contains {1} icons, CSS is {2}'.format(
+            sprite_manifest['url'], len(sprite_manifest['positions']), sprite_manifest['css_url']))
@@ -0,0 +1,188 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from functools import partial
+from urllib.parse import urljoin
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connections
+from django.template.loader import get_template
+from django.template.loader import render_to_string
+
+from pokemon_entities.catalogue import build_species_catalogue
+from pokemon_entities.catalogue import get_sprite_sheet
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonElementType
+from pokemon_entities.models import PokemonEvolutionLink
+from pokemon_entities.views import get_page_pokemons
+from pokemon_entities.views import get_pokemon_on_page
+from pokemon_entities.views import make_etag
+from pokemon_entities.views import render_api_map
+from pokemon_entities.workers import setup_worker
+
+
+MANIFEST_NAME = '.export_manifest.json'
+MAINPAGE_PATH = 'index.html'
+POKEMON_PAGE_PATH = 'pokemon/{pokemon_id}/index.html'
+
+
+def get_template_source(template_name):
+    """Give source of the template, so pages are exported again after the template changes."""
+    return get_template(template_name).template.source
+
+
+def get_pokemon_page_fingerprints(base_url):
+    """Give fingerprints of pokemon pages made of timestamps of everything shown on them.
+
+    Pokemon page shows the pokemon, its whole evolution family from the first stage (siblings
+    too, see get_evolution_chain()), its element types and element types they are strong
+    against, so fingerprint changes when any of them is saved or relinked. Data of all pages
+    is read by five queries.
+
+    :param base_url: URL of the site the pages are exported for
+    :type: string
+    :return: dict like {pokemon_id: fingerprint}
+    :type: dict
+    """
+    species = {pokemon_id: (updated_at.isoformat(), image_hash) for pokemon_id, updated_at, image_hash in
+               Pokemon.objects.values_list('id', 'updated_at', 'image_hash')}
+    element_types = {element_id: (updated_at.isoformat(), image_hash) for element_id, updated_at, image_hash in
+                     PokemonElementType.objects.values_list('id', 'updated_at', 'image_hash')}
+    species_types = defaultdict(set)
+    for pokemon_id, element_id in Pokemon.element_type.through.objects.values_list(
+            'pokemon_id', 'pokemonelementtype_id'):
+        species_types[pokemon_id].add(element_id)
+    strong_against = defaultdict(set)
+    for element_id, strong_against_id in PokemonElementType.strong_against.through.objects.values_list(
+            'from_pokemonelementtype_id', 'to_pokemonelementtype_id'):
+        strong_against[element_id].add(strong_against_id)
+    descendants = defaultdict(set)
+    family_roots = {}
+    for ancestor_id, descendant_id, depth in PokemonEvolutionLink.objects.values_list(
+            'ancestor_id', 'descendant_id', 'depth'):
+        descendants[ancestor_id].add(descendant_id)
+        if depth >= family_roots.get(descendant_id, (-1, None))[0]:
+            family_roots[descendant_id] = (depth, ancestor_id)
+
+    template_source = get_template_source('pokemon.html')
+    fingerprints = {}
+    for pokemon_id in species:
+        root_id = family_roots.get(pokemon_id, (0, pokemon_id))[1]
+        page_species = sorted(descendants[root_id] | {pokemon_id})
+        page_element_types = sorted(species_types[pokemon_id])
+        fingerprints[pokemon_id] = make_etag(
+            base_url,
+            template_source,
+            [(specie_id, species.get(specie_id)) for specie_id in page_species],
+            [(element_id, element_types[element_id], sorted(
+                (strong_id, element_types[strong_id]) for strong_id in strong_against[element_id]))
+             for element_id in page_element_types],
+        )
+    return fingerprints
+
+
+def write_page(output_dir, path, html):
+    """Write the page atomically, so web server never gives half-written file."""
+    full_path = os.path.join(output_dir, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    temporary_path = '{0}.{1}.tmp'.format(full_path, os.getpid())
+    with open(temporary_path, 'w', encoding='utf-8') as page_file:
+        page_file.write(html)
+    os.replace(temporary_path, full_path)
+
+
+def export_pokemon_page(pokemon_id, output_dir, base_url):
+    """Render pokemon page and write it into output_dir, runs in worker process.
+
+    :return: id of the exported pokemon, None if it was deleted meanwhile
+    :type: int
+    """
+    pokemon = get_page_pokemons().filter(id=pokemon_id).first()
+    if pokemon is None:
+        return None
+    html = render_to_string('pokemon.html', context={
+        'map': render_api_map(partial(urljoin, base_url), pokemon_id=pokemon_id),
+        'pokemon': get_pokemon_on_page(pokemon),
+    })
+    write_page(output_dir, POKEMON_PAGE_PATH.format(pokemon_id=pokemon_id), html)
+    return pokemon_id
+
+
+class Command(BaseCommand):
+    help = '''Render the main page and pages of all pokemon species into static HTML files.
+
+    Files are laid out as URLs of the site (index.html, pokemon/<id>/index.html), so a web
+    server may give them without Django. Maps of the pages load pokemon entities from the API
+    of the site at --base-url. Only pages whose data, template or RELEASE have changed since
+    the previous export are rendered again, by --jobs worker processes.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='directory for HTML files')
+        parser.add_argument('--base-url', required=True,
+                            help='URL of the Django site serving the API, e.g. https://pogomap.example.com/')
+        parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                            help='number of worker processes')
+        parser.add_argument('--force', action='store_true', help='render all pages again')
+
+    def handle(self, *args, **options):
+        if options['jobs'] < 1:
+            raise CommandError('Number of jobs must be positive')
+        output_dir = options['output']
+        base_url = options['base_url']
+        os.makedirs(output_dir, exist_ok=True)
+        started_at = time.monotonic()
+
+        manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        manifest = {}
+        if os.path.exists(manifest_path) and not options['force']:
+            with open(manifest_path, encoding='utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
+
+        def is_actual(path, fingerprint):
+            return manifest.get(path) == fingerprint and os.path.exists(os.path.join(output_dir, path))
+
+        new_manifest = {}
+        pokemons = build_species_catalogue()
+        sprite_sheet = get_sprite_sheet()
+        mainpage_fingerprint = make_etag(base_url, get_template_source('mainpage.html'), pokemons, sprite_sheet)
+        if not is_actual(MAINPAGE_PATH, mainpage_fingerprint):
+            write_page(output_dir, MAINPAGE_PATH, render_to_string('mainpage.html', context={
+                'map': render_api_map(partial(urljoin, base_url)),
+                'pokemons': pokemons,
+                'sprite_sheet': sprite_sheet,
+            }))
+            self.stdout.write('Main page is exported')
+        new_manifest[MAINPAGE_PATH] = mainpage_fingerprint
+
+        fingerprints = get_pokemon_page_fingerprints(base_url)
+        changed_ids = [pokemon_id for pokemon_id, fingerprint in sorted(fingerprints.items())
+                       if not is_actual(POKEMON_PAGE_PATH.format(pokemon_id=pokemon_id), fingerprint)]
+        exported_ids = set()
+        if changed_ids:
+            # workers must open their own connections instead of sharing ones of this process
+            connections.close_all()
+            export = partial(export_pokemon_page, output_dir=output_dir, base_url=base_url)
+            with multiprocessing.Pool(min(options['jobs'], len(changed_ids)),
+                                      initializer=setup_worker) as pool:
+                for pokemon_id in pool.imap_unordered(export, changed_ids, chunksize=8):
+                    if pokemon_id is not None:
+                        exported_ids.add(pokemon_id)
+        for pokemon_id, fingerprint in fingerprints.items():
+            path = POKEMON_PAGE_PATH.format(pokemon_id=pokemon_id)
+            if pokemon_id in exported_ids or is_actual(path, fingerprint):
+                new_manifest[path] = fingerprint
+
+        deleted_count = 0
+        for path in set(manifest) - set(new_manifest):
+            full_path = os.path.join(output_dir, path)
+            if os.path.exists(full_path):
+                os.remove(full_path)
+                deleted_count += 1
+
+        with open(manifest_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(new_manifest, manifest_file, indent=2, sort_keys=True)
+        self.stdout.write('Pokemon pages: {0} exported, {1} not changed, {2} deleted in {3:.1f} s'.format(
+            len(exported_ids), len(fingerprints) - len(changed_ids), deleted_count, time.monotonic() - started_at))
@@ -0,0 +1,170 @@
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from pokemon_entities.geo import get_tile_key
+from pokemon_entities.heatmap import add_entities_to_rollup
+from pokemon_entities.map_cache import invalidate_entities
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonEntity
+from pokemon_entities.nearest import STAT_FIELDS
+
+
+def read_ndjson(spawns_file):
+    for line in spawns_file:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def parse_moment(raw_moment):
+    """Parse datetime from ISO 8601 string or UNIX timestamp.
+
+    :param raw_moment: ISO 8601 string or UNIX timestamp
+    :type: string, int or float
+    :return: aware datetime, None if raw_moment is empty
+    :type: datetime
+    :raises ValueError: if raw_moment is malformed
+    """
+    if raw_moment in (None, ''):
+        return None
+    if isinstance(raw_moment, str) and raw_moment.replace('.', '', 1).isdigit():
+        raw_moment = float(raw_moment)
+    if isinstance(raw_moment, (int, float)):
+        return datetime.fromtimestamp(raw_moment, timezone.utc)
+    moment = parse_datetime(raw_moment)
+    if moment is None:
+        raise ValueError('Invalid datetime: {0}'.format(raw_moment))
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = '''Import pokemon entities from NDJSON or CSV file (or stdin).
+
+    Every row must have fields latitude (or lat), longitude (or lon) and pokemon_id or pokemon
+    (english title of pokemon specie), and may have appear_at, disappear_at (ISO 8601 or UNIX
+    timestamp), level, health, strength, defence and stamina.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='path to the file, "-" to read stdin')
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='format of the file, by default is guessed by extension')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='number of rows written in one transaction')
+        parser.add_argument('--strict', action='store_true',
+                            help='stop on the first invalid row instead of skipping it')
+
+    def handle(self, *args, **options):
+        spawns_format = options['format']
+        if spawns_format is None:
+            spawns_format = 'csv' if options['path'].endswith('.csv') else 'ndjson'
+        if options['batch_size'] < 1:
+            raise CommandError('Batch size must be positive')
+
+        self.species_ids = set(Pokemon.objects.values_list('id', flat=True))
+        self.species_by_title = {title.lower(): pokemon_id for pokemon_id, title in
+                                 Pokemon.objects.exclude(title_en='').values_list('id', 'title_en')}
+
+        if options['path'] == '-':
+            spawns_file = sys.stdin
+        else:
+            try:
+                spawns_file = open(options['path'], encoding='utf-8', newline='')
+            except OSError as error:
+                raise CommandError(error)
+
+        started_at = time.monotonic()
+        imported_count = 0
+        skipped_count = 0
+        batch = []
+        if spawns_format == 'csv':
+            rows, decode_row = csv.DictReader(spawns_file), dict
+        else:
+            rows, decode_row = read_ndjson(spawns_file), json.loads
+        try:
+            for row_number, row in enumerate(rows, start=1):
+                try:
+                    batch.append(self.parse_spawn(decode_row(row)))
+                except (ValueError, TypeError, KeyError, AttributeError) as error:
+                    if options['strict']:
+                        raise CommandError('Row {0}: {1}'.format(row_number, error))
+                    skipped_count += 1
+                    self.stderr.write('Row {0} is skipped: {1}'.format(row_number, error))
+                    continue
+                if len(batch) >= options['batch_size']:
+                    imported_count += self.save_batch(batch)
+                    batch = []
+                    self.report(imported_count, skipped_count, started_at)
+            imported_count += self.save_batch(batch)
+        finally:
+            if spawns_file is not sys.stdin:
+                spawns_file.close()
+
+        self.report(imported_count, skipped_count, started_at)
+
+    def parse_spawn(self, row):
+        """Make pokemon entity from the row, the entity is not saved.
+
+        :param row: fields of pokemon entity
+        :type: dict
+        :return: pokemon entity
+        :type: PokemonEntity
+        :raises ValueError: if the row is invalid
+        """
+        if not isinstance(row, dict):
+            raise ValueError('Row must be an object')
+        if row.get('pokemon_id') not in (None, ''):
+            pokemon_id = int(row['pokemon_id'])
+            if pokemon_id not in self.species_ids:
+                raise ValueError('Unknown pokemon_id: {0}'.format(pokemon_id))
+        else:
+            pokemon_id = self.species_by_title.get(str(row.get('pokemon', '')).lower())
+            if pokemon_id is None:
+                raise ValueError('Unknown pokemon: {0}'.format(row.get('pokemon')))
+
+        latitude = float(row['latitude'] if 'latitude' in row else row['lat'])
+        longitude = float(row['longitude'] if 'longitude' in row else row['lon'])
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError('Coordinates are out of range: {0}, {1}'.format(latitude, longitude))
+
+        appear_at = parse_moment(row.get('appear_at'))
+        disappear_at = parse_moment(row.get('disappear_at'))
+        if appear_at and disappear_at and appear_at > disappear_at:
+            raise ValueError('appear_at is later than disappear_at')
+
+        stats = {field: int(row[field]) if row.get(field) not in (None, '') else 0
+                 for field in STAT_FIELDS}
+        return PokemonEntity(
+            pokemon_id=pokemon_id,
+            latitude=latitude,
+            longitude=longitude,
+            tile_key=get_tile_key(latitude, longitude),
+            appear_at=appear_at,
+            disappear_at=disappear_at,
+            **stats
+        )
+
+    def save_batch(self, batch):
+        if not batch:
+            return 0
+        with transaction.atomic():
+            PokemonEntity.objects.bulk_create(batch)
+            add_entities_to_rollup(batch)
+        # maps and tiles show every committed batch, not only the whole import
+        invalidate_entities()
+        return len(batch)
+
+    def report(self, imported_count, skipped_count, started_at):
+        elapsed = time.monotonic() - started_at
+        self.stdout.write('Imported {0} rows, skipped {1} rows in {2:.1f} s ({3:.0f} rows/s)'.format(
+            imported_count, skipped_count, elapsed, imported_count / elapsed if elapsed else 0))
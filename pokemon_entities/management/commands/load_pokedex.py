@@ -0,0 +1,182 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+
+from pokemon_entities.catalogue import invalidate_species_catalogue
+from pokemon_entities.evolutions import rebuild_evolution_links
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonElementType
+
+
+POKEDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                            'pokemons.json')
+POKEMON_FIELDS = {
+    'title': 'title_ru',
+    'title_en': 'title_en',
+    'title_jp': 'title_jp',
+    'description': 'description',
+}
+
+
+def get_evolution_links(pokedex_species):
+    """Give previous evolution of every pokemon specie from the pokedex.
+
+    The link may be given either by previous_evolution of the specie or by next_evolution
+    of the previous one.
+
+    :param pokedex_species: species from the pokedex
+    :type: list
+    :return: dict like {pokemon_id: id of previous evolution or None}
+    :type: dict
+    """
+    previous_evolutions = {specie['pokemon_id']: None for specie in pokedex_species}
+    for specie in pokedex_species:
+        if specie.get('previous_evolution'):
+            previous_evolutions[specie['pokemon_id']] = specie['previous_evolution']['pokemon_id']
+    for specie in pokedex_species:
+        next_evolution_id = specie.get('next_evolution', {}).get('pokemon_id')
+        if next_evolution_id in previous_evolutions:
+            previous_evolutions[next_evolution_id] = specie['pokemon_id']
+    return previous_evolutions
+
+
+def sync_m2m(through, source_field, target_field, source_ids, edges):
+    """Make links of M2M relation of source_ids objects equal to edges.
+
+    :param through: through model of M2M relation
+    :type: Model
+    :param source_field: name of the through model field which points to the source object
+    :type: string
+    :param target_field: name of the through model field which points to the target object
+    :type: string
+    :param source_ids: ids of source objects whose links are synchronized
+    :type: iterable
+    :param edges: required links, set of tuples (source_id, target_id)
+    :type: set
+    :return: tuple (number of created links, number of deleted links)
+    :type: tuple
+    """
+    existing_links = through.objects.filter(**{source_field + '__in': list(source_ids)}).values_list(
+        'id', source_field, target_field)
+    existing_edges = {}
+    for link_id, source_id, target_id in existing_links:
+        existing_edges[(source_id, target_id)] = link_id
+
+    stale_link_ids = [link_id for edge, link_id in existing_edges.items() if edge not in edges]
+    if stale_link_ids:
+        through.objects.filter(id__in=stale_link_ids).delete()
+    new_links = [through(**{source_field: source_id, target_field: target_id})
+                 for source_id, target_id in sorted(edges - set(existing_edges))]
+    through.objects.bulk_create(new_links)
+    return len(new_links), len(stale_link_ids)
+
+
+class Command(BaseCommand):
+    help = '''Create or update pokemon species from the pokedex JSON file.
+
+    The file is like {"pokemons": [...], "element_types": [...]}. Every pokemon has fields
+    pokemon_id, title_ru, title_en, title_jp, description, optional previous_evolution and
+    next_evolution (objects with pokemon_id) and optional element_type (list of element titles).
+    Every element type has fields title and optional strong_against (list of element titles).
+    The command runs a constant number of queries and is safe to run again.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=POKEDEX_PATH,
+                            help='path to the pokedex, pokemons.json of the app by default')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8') as pokedex_file:
+                pokedex = json.load(pokedex_file)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        with transaction.atomic():
+            element_types = self.load_element_types(pokedex)
+            self.load_species(pokedex['pokemons'], element_types)
+        invalidate_species_catalogue()
+
+    def load_element_types(self, pokedex):
+        """Create missing element types and synchronize their strong_against links.
+
+        :return: dict like {title: id} with all element types mentioned in the pokedex
+        :type: dict
+        """
+        pokedex_element_types = {element_type['title']: element_type
+                                 for element_type in pokedex.get('element_types', [])}
+        titles = set(pokedex_element_types)
+        for element_type in pokedex_element_types.values():
+            titles.update(element_type.get('strong_against', []))
+        for specie in pokedex['pokemons']:
+            titles.update(specie.get('element_type', []))
+        if not titles:
+            return {}
+
+        existing_titles = set(PokemonElementType.objects.filter(title__in=titles).values_list('title', flat=True))
+        PokemonElementType.objects.bulk_create(
+            [PokemonElementType(title=title) for title in sorted(titles - existing_titles)])
+        element_types = dict(PokemonElementType.objects.filter(title__in=titles).values_list('title', 'id'))
+        self.stdout.write('Element types: {0} created'.format(len(titles - existing_titles)))
+
+        if pokedex_element_types:
+            edges = {(element_types[title], element_types[strong_against_title])
+                     for title, element_type in pokedex_element_types.items()
+                     for strong_against_title in element_type.get('strong_against', [])}
+            created_count, deleted_count = sync_m2m(
+                PokemonElementType.strong_against.through, 'from_pokemonelementtype_id',
+                'to_pokemonelementtype_id', [element_types[title] for title in pokedex_element_types], edges)
+            self.stdout.write('Strong against links: {0} created, {1} deleted'.format(created_count, deleted_count))
+        return element_types
+
+    def load_species(self, pokedex_species, element_types):
+        now = timezone.now()
+        existing_species = Pokemon.objects.in_bulk([specie['pokemon_id'] for specie in pokedex_species])
+        new_species = []
+        changed_species = []
+        for specie in pokedex_species:
+            values = {field: specie.get(key, '') for field, key in POKEMON_FIELDS.items()}
+            pokemon = existing_species.get(specie['pokemon_id'])
+            if pokemon is None:
+                new_species.append(Pokemon(id=specie['pokemon_id'], **values))
+            elif any(getattr(pokemon, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(pokemon, field, value)
+                pokemon.updated_at = now
+                changed_species.append(pokemon)
+        Pokemon.objects.bulk_create(new_species)
+        # bulk_update() doesn't set auto_now fields
+        Pokemon.objects.bulk_update(changed_species, list(POKEMON_FIELDS) + ['updated_at'])
+        if new_species:
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Pokemon]):
+                    cursor.execute(sql)
+        self.stdout.write('Species: {0} created, {1} updated'.format(len(new_species), len(changed_species)))
+
+        species = dict(existing_species)
+        species.update((pokemon.id, pokemon) for pokemon in new_species)
+        relinked_species = []
+        for pokemon_id, previous_evolution_id in get_evolution_links(pokedex_species).items():
+            pokemon = species[pokemon_id]
+            if pokemon.previous_evolution_id != previous_evolution_id:
+                pokemon.previous_evolution_id = previous_evolution_id
+                pokemon.updated_at = now
+                relinked_species.append(pokemon)
+        Pokemon.objects.bulk_update(relinked_species, ['previous_evolution', 'updated_at'])
+        if new_species or relinked_species:
+            rebuild_evolution_links()
+        self.stdout.write('Evolutions: {0} updated'.format(len(relinked_species)))
+
+        species_with_types = [specie for specie in pokedex_species if 'element_type' in specie]
+        if species_with_types:
+            edges = {(specie['pokemon_id'], element_types[title])
+                     for specie in species_with_types for title in specie['element_type']}
+            created_count, deleted_count = sync_m2m(
+                Pokemon.element_type.through, 'pokemon_id', 'pokemonelementtype_id',
+                [specie['pokemon_id'] for specie in species_with_types], edges)
+            self.stdout.write('Element type links: {0} created, {1} deleted'.format(created_count, deleted_count))
@@ -0,0 +1,81 @@
+import gzip
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from pokemon_entities.models import PokemonEntity
+from pokemon_entities.models import PokemonEntityArchive
+from pokemon_entities.models import delete_entities_by_ids
+
+
+ARCHIVED_FIELDS = ['id', 'pokemon_id', 'latitude', 'longitude', 'appear_at', 'disappear_at',
+                   'level', 'health', 'strength', 'defence', 'stamina']
+
+
+class Command(BaseCommand):
+    help = '''Move expired pokemon entities out of the table of pokemon entities.
+
+    Entities which disappeared earlier than --grace seconds ago are moved in chunks, every
+    chunk in its own short transaction, to the archive table, to gzipped NDJSON file or
+    nowhere. With --interval the command keeps running and repeats pruning periodically.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--archive', choices=['table', 'ndjson', 'none'], default='table',
+                            help='where to move expired entities')
+        parser.add_argument('--output', help='path to gzipped NDJSON file for --archive=ndjson, '
+                                             'data is appended to the existing file')
+        parser.add_argument('--grace', type=int, default=60 * 60,
+                            help='keep entities which disappeared less than this number of seconds ago')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='number of entities moved in one transaction')
+        parser.add_argument('--interval', type=int,
+                            help='repeat pruning every this number of seconds')
+
+    def handle(self, *args, **options):
+        if options['archive'] == 'ndjson' and not options['output']:
+            raise CommandError('--output is required for --archive=ndjson')
+        if options['chunk_size'] < 1:
+            raise CommandError('Chunk size must be positive')
+
+        while True:
+            self.prune(options)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def prune(self, options):
+        cutoff = timezone.now() - timedelta(seconds=options['grace'])
+        expired_entities = PokemonEntity.objects.filter(disappear_at__lt=cutoff).order_by('disappear_at')
+        pruned_count = 0
+        started_at = time.monotonic()
+        while True:
+            with transaction.atomic():
+                chunk = list(expired_entities.values_list(*ARCHIVED_FIELDS)[:options['chunk_size']])
+                if not chunk:
+                    break
+                self.archive(chunk, options)
+                # expired entities are not on maps, so post_delete signals are not needed
+                delete_entities_by_ids([row[0] for row in chunk])
+            pruned_count += len(chunk)
+
+        self.stdout.write('{0}: pruned {1} entities which disappeared before {2} in {3:.1f} s'.format(
+            timezone.now().isoformat(), pruned_count, cutoff.isoformat(), time.monotonic() - started_at))
+
+    def archive(self, chunk, options):
+        if options['archive'] == 'table':
+            PokemonEntityArchive.objects.bulk_create([
+                PokemonEntityArchive(entity_id=row[0], **dict(zip(ARCHIVED_FIELDS[1:], row[1:])))
+                for row in chunk
+            ])
+        elif options['archive'] == 'ndjson':
+            with gzip.open(options['output'], 'at', encoding='utf-8') as archive_file:
+                for row in chunk:
+                    entity = dict(zip(ARCHIVED_FIELDS, row))
+                    for field in ['appear_at', 'disappear_at']:
+                        entity[field] = entity[field].isoformat() if entity[field] else None
+                    archive_file.write(json.dumps(entity, ensure_ascii=False) + '\n')
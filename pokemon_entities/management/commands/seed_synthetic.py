@@ -0,0 +1,91 @@
+import math
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from pokemon_entities.geo import METERS_PER_DEGREE
+from pokemon_entities.geo import get_tile_key
+from pokemon_entities.heatmap import add_entities_to_rollup
+from pokemon_entities.map_cache import invalidate_entities
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonEntity
+from pokemon_entities.views import MOSCOW_CENTER
+
+
+SYNTHETIC_TITLE = 'Синтетический покемон {0}'
+SYNTHETIC_TITLE_EN = 'Synthetic {0}'
+
+
+class Command(BaseCommand):
+    help = '''Fill DB with synthetic pokemon entities for benchmarks.
+
+    Entities are scattered around MOSCOW_CENTER with normal distribution, their appear_at
+    is uniform in the time window around now and life time is exponential, so the share of
+    active entities depends on --window and --lifetime. Missing species are created.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entities', type=int, default=10000, help='number of entities to create')
+        parser.add_argument('--species', type=int, default=150, help='number of species to spread entities over')
+        parser.add_argument('--radius', type=float, default=8000,
+                            help='standard deviation of distance from the center in meters')
+        parser.add_argument('--window', type=int, default=24 * 60,
+                            help='appear_at is uniform in [now - window, now + window] minutes')
+        parser.add_argument('--lifetime', type=int, default=30, help='mean life time of entity in minutes')
+        parser.add_argument('--batch-size', type=int, default=5000, help='number of entities in one transaction')
+        parser.add_argument('--seed', type=int, help='seed of random generator for reproducible data')
+
+    def handle(self, *args, **options):
+        if options['entities'] < 0 or options['species'] < 1 or options['batch_size'] < 1:
+            raise CommandError('Numbers of entities, species and batch size must be positive')
+        generator = random.Random(options['seed'])
+
+        pokemon_ids = list(Pokemon.objects.order_by('id').values_list('id', flat=True)[:options['species']])
+        missing_count = options['species'] - len(pokemon_ids)
+        if missing_count > 0:
+            first_number = Pokemon.objects.count() + 1
+            Pokemon.objects.bulk_create([
+                Pokemon(title=SYNTHETIC_TITLE.format(number), title_en=SYNTHETIC_TITLE_EN.format(number))
+                for number in range(first_number, first_number + missing_count)
+            ])
+            pokemon_ids = list(Pokemon.objects.order_by('id').values_list('id', flat=True)[:options['species']])
+            self.stdout.write('Created {0} species'.format(missing_count))
+
+        now = timezone.now()
+        center_lat, center_lon = MOSCOW_CENTER
+        meters_per_lon_degree = METERS_PER_DEGREE * math.cos(math.radians(center_lat))
+        started_at = time.monotonic()
+        created_count = 0
+        while created_count < options['entities']:
+            batch = []
+            for _ in range(min(options['batch_size'], options['entities'] - created_count)):
+                latitude = center_lat + generator.gauss(0, options['radius']) / METERS_PER_DEGREE
+                longitude = center_lon + generator.gauss(0, options['radius']) / meters_per_lon_degree
+                appear_at = now + timedelta(minutes=generator.uniform(-options['window'], options['window']))
+                lifetime = timedelta(minutes=generator.expovariate(1 / options['lifetime']))
+                batch.append(PokemonEntity(
+                    pokemon_id=generator.choice(pokemon_ids),
+                    latitude=latitude,
+                    longitude=longitude,
+                    tile_key=get_tile_key(latitude, longitude),
+                    appear_at=appear_at,
+                    disappear_at=appear_at + lifetime,
+                    level=generator.randint(1, 40),
+                    health=generator.randint(10, 300),
+                    strength=generator.randint(10, 300),
+                    defence=generator.randint(10, 300),
+                    stamina=generator.randint(10, 300),
+                ))
+            with transaction.atomic():
+                PokemonEntity.objects.bulk_create(batch)
+                add_entities_to_rollup(batch)
+            created_count += len(batch)
+        invalidate_entities()
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write('Created {0} entities in {1:.1f} s, {2} of them are active now'.format(
+            created_count, elapsed, PokemonEntity.objects.active(at=now).count()))
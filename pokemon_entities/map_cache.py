@@ -0,0 +1,128 @@
+"""Cache of rendered folium maps.
+
+Rendered map is kept in Django cache under the key made of view name, pokemon id, site
+address, version of species catalogue and version of pokemon entities shown on the map. The
+entities version is given by the view, e.g. digest of rows of the spawn snapshot (see
+snapshot.py), which is refreshed from the database, so writes of any process, like import_spawns,
+change the key without a shared cache. The set of active entities also changes without writes,
+when some entity appears or disappears, so rendered map is kept in cache only until the nearest
+such moment. A map read from a replica soon after a write may miss
+the write, so such map is kept in cache only until DB_REPLICA_STALENESS has passed.
+"""
+
+import hashlib
+import math
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from pokemon_entities.catalogue import get_catalogue_version
+from pokemon_entities.db_router import get_read_replica
+
+
+ENTITIES_VERSION_KEY = 'pokemon_entities:version'
+ENTITIES_CHANGED_AT_KEY = 'pokemon_entities:changed_at'
+MAP_HTML_KEY = 'map_html:{digest}'
+MAP_CACHE_TIMEOUT = 5 * 60
+
+map_cache_stats = Counter()
+map_cache_stats_lock = threading.Lock()
+
+
+def get_entities_version():
+    """Give current version of pokemon entities.
+
+    :return: version of pokemon entities
+    :type: string
+    """
+    version = cache.get(ENTITIES_VERSION_KEY)
+    if version is None:
+        cache.add(ENTITIES_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(ENTITIES_VERSION_KEY)
+    return version
+
+
+def invalidate_entities():
+    """Replace version of pokemon entities, so spawn snapshot of this process is refreshed at once.
+
+    Must be called after changes made without model signals, e.g. bulk_create() or update().
+    update() doesn't set updated_at of entities, which spawn snapshots are refreshed by, so it
+    must be set by hand.
+    """
+    cache.set_many({ENTITIES_VERSION_KEY: uuid.uuid4().hex, ENTITIES_CHANGED_AT_KEY: time.time()}, None)
+
+
+def get_replica_lag_window():
+    """Give number of seconds while data read from a replica may still miss the last write of entities.
+
+    :return: seconds, 0 if reads of the current thread go to the primary database
+    :type: float
+    """
+    if get_read_replica() is None:
+        return 0
+    changed_at = cache.get(ENTITIES_CHANGED_AT_KEY)
+    if changed_at is None:
+        return 0
+    return max(changed_at + settings.DB_REPLICA_STALENESS - time.time(), 0)
+
+
+def get_map_cache_stats():
+    """Give number of hits and misses of map cache in this process.
+
+    :return: dict with keys hits and misses
+    :type: dict
+    """
+    with map_cache_stats_lock:
+        return {'hits': map_cache_stats['hits'], 'misses': map_cache_stats['misses']}
+
+
+def get_map_html(request, view_name, render_map, entities_version=None, get_next_boundary=None, pokemon_id=None):
+    """Give rendered map from cache or render it and put to cache.
+
+    :param request: 
+    :type: HttpRequest
+    :param view_name: name of the view showing the map
+    :type: string
+    :param render_map: function without arguments which gives HTML of the map
+    :type: function
+    :param entities_version: version of pokemon entities shown on the map, derived from the database,
+                             None if map doesn't contain entities
+    :type: string
+    :param get_next_boundary: function which gives the nearest moment after the given one when
+                              entities on the map change, None if map doesn't contain entities
+    :type: function
+    :param pokemon_id: id of pokemon specie shown on the map
+    :type: int
+    :return: tuple (HTML of the map, True if it was taken from cache)
+    :type: tuple
+    """
+    key_parts = [view_name, pokemon_id, request.build_absolute_uri('/'),
+                 entities_version, get_catalogue_version()]
+    digest = hashlib.md5(repr(key_parts).encode('utf-8')).hexdigest()
+    map_html_key = MAP_HTML_KEY.format(digest=digest)
+
+    map_html = cache.get(map_html_key)
+    with map_cache_stats_lock:
+        map_cache_stats['hits' if map_html is not None else 'misses'] += 1
+    if map_html is not None:
+        return map_html, True
+
+    now = timezone.now()
+    map_html = render_map()
+    timeout = MAP_CACHE_TIMEOUT
+    if get_next_boundary is not None:
+        next_boundary = get_next_boundary(now)
+        if next_boundary is not None:
+            seconds_to_boundary = (next_boundary - timezone.now()).total_seconds()
+            timeout = min(timeout, max(int(seconds_to_boundary), 0))
+    lag_window = get_replica_lag_window()
+    if lag_window:
+        timeout = min(timeout, math.ceil(lag_window))
+    if timeout:
+        cache.set(map_html_key, map_html, timeout)
+    return map_html, False
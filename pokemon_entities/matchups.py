@@ -0,0 +1,124 @@
+"""Effectiveness of pokemon element types against each other as NumPy arrays.
+
+The matrix is built once per process from strong_against links and element types of species,
+and is rebuilt when species catalogue version changes (see catalogue.py), which happens
+after any change of species, element types and links between them.
+"""
+
+import threading
+
+import numpy as np
+
+from pokemon_entities.catalogue import get_catalogue_version
+from pokemon_entities.db_router import replica_reads
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonElementType
+
+
+STRONG_MULTIPLIER = 2.0
+
+matchup_matrix = None
+matchup_matrix_lock = threading.Lock()
+
+
+class MatchupMatrix:
+    """Effectiveness of element types and element types of species.
+
+    effectiveness[attacking, defending] is multiplier of attack of element type with index
+    attacking against element type with index defending. species_types[specie, element] is
+    True if the specie with index specie has element type with index element.
+    """
+
+    def __init__(self, version, element_ids, strong_against_pairs, species_ids, species_type_pairs):
+        self.version = version
+        self.element_index = {element_id: index for index, element_id in enumerate(element_ids)}
+        self.species_ids = np.array(species_ids, dtype=np.int64)
+        species_index = {pokemon_id: index for index, pokemon_id in enumerate(species_ids)}
+
+        self.effectiveness = np.ones((len(element_ids), len(element_ids)))
+        if strong_against_pairs:
+            attacking, defending = zip(*[(self.element_index[attacking_id], self.element_index[defending_id])
+                                         for attacking_id, defending_id in strong_against_pairs])
+            self.effectiveness[list(attacking), list(defending)] = STRONG_MULTIPLIER
+
+        self.species_types = np.zeros((len(species_ids), len(element_ids)), dtype=bool)
+        if species_type_pairs:
+            species, elements = zip(*[(species_index[pokemon_id], self.element_index[element_id])
+                                      for pokemon_id, element_id in species_type_pairs])
+            self.species_types[list(species), list(elements)] = True
+
+    def get_species_types(self, pokemon_id):
+        """Give ids of element types of pokemon specie."""
+        specie_index = np.flatnonzero(self.species_ids == pokemon_id)
+        if not specie_index.size:
+            return []
+        element_ids = np.array(sorted(self.element_index, key=self.element_index.get))
+        return element_ids[self.species_types[specie_index[0]]].tolist()
+
+    def rank_counters(self, element_ids):
+        """Rank all species by advantage over pokemon of element types element_ids.
+
+        Offence of specie is the best multiplier of its element types against all defending
+        types together, threat is the best multiplier of defending types against the specie.
+        Species without element types have neutral offence and threat 1. Advantage is
+        offence divided by threat.
+
+        :param element_ids: ids of element types of the defending pokemon
+        :type: list
+        :return: tuple of arrays (pokemon ids, advantage, offence, threat), sorted from the best
+                 counter to the worst one
+        :type: tuple
+        """
+        defending = [self.element_index[element_id] for element_id in element_ids
+                     if element_id in self.element_index]
+        has_types = self.species_types.any(axis=1)
+
+        attack_multipliers = self.effectiveness[:, defending].prod(axis=1)
+        offence = np.where(self.species_types, attack_multipliers, 0).max(axis=1, initial=0)
+        offence = np.where(has_types, offence, 1.0)
+
+        if defending:
+            log_effectiveness = np.log(self.effectiveness[defending, :])
+            threat = np.exp(self.species_types.astype(float) @ log_effectiveness.T).max(axis=1)
+        else:
+            threat = np.ones(len(self.species_ids))
+        threat = np.where(has_types, threat, 1.0)
+
+        advantage = offence / threat
+        order = np.lexsort((self.species_ids, -offence, -advantage))
+        return self.species_ids[order], advantage[order], offence[order], threat[order]
+
+
+@replica_reads(False)
+def build_matchup_matrix(version):
+    """Build matchup matrix from the primary database by four queries.
+
+    :param version: version of species catalogue the matrix is built for
+    :type: string
+    :return: matchup matrix
+    :type: MatchupMatrix
+    """
+    element_ids = list(PokemonElementType.objects.order_by('id').values_list('id', flat=True))
+    strong_against_pairs = list(PokemonElementType.strong_against.through.objects.values_list(
+        'from_pokemonelementtype_id', 'to_pokemonelementtype_id'))
+    species_ids = list(Pokemon.objects.order_by('id').values_list('id', flat=True))
+    species_type_pairs = list(Pokemon.element_type.through.objects.values_list(
+        'pokemon_id', 'pokemonelementtype_id'))
+    return MatchupMatrix(version, element_ids, strong_against_pairs, species_ids, species_type_pairs)
+
+
+def get_matchup_matrix():
+    """Give matchup matrix for the current version of species catalogue.
+
+    :return: matchup matrix
+    :type: MatchupMatrix
+    """
+    global matchup_matrix
+    version = get_catalogue_version()
+    current_matrix = matchup_matrix
+    if current_matrix is not None and current_matrix.version == version:
+        return current_matrix
+    with matchup_matrix_lock:
+        if matchup_matrix is None or matchup_matrix.version != version:
+            matchup_matrix = build_matchup_matrix(version)
+        return matchup_matrix
@@ -0,0 +1,141 @@
+"""Per-request timings of views and their histograms.
+
+MetricsMiddleware opens timings of the request, counts SQL queries and their time, and puts
+timings of the request stages to histograms and to the Server-Timing header. Views mark their
+stages with measure(). Histograms are kept in memory of the process and given in Prometheus
+text format by show_metrics view.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from pokemon_entities.map_cache import get_map_cache_stats
+
+
+SECONDS_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUERIES_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200]
+
+request_timings = threading.local()
+
+
+class Histogram:
+    """Histogram of observed values with fixed buckets, like Prometheus histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.bucket_counts[index] += 1
+
+
+class HistogramRegistry:
+    """Histograms by metric name and labels, safe to use from several threads.
+
+    Histograms are kept as {name: {labels: Histogram}}, so every metric is exported as one
+    block under its TYPE line, as Prometheus text format requires.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = OrderedDict()
+
+    def observe(self, name, labels, value, buckets=SECONDS_BUCKETS):
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            histograms = self.histograms.setdefault(name, OrderedDict())
+            histogram = histograms.get(labels)
+            if histogram is None:
+                histogram = histograms[labels] = Histogram(buckets)
+            histogram.observe(value)
+
+    def export(self):
+        """Give all histograms in Prometheus text format.
+
+        :return: text in Prometheus exposition format
+        :type: string
+        """
+        lines = []
+        with self.lock:
+            for name, histograms in self.histograms.items():
+                lines.append('# TYPE {0} histogram'.format(name))
+                for labels, histogram in histograms.items():
+                    labels_text = ','.join('{0}="{1}"'.format(label, value) for label, value in labels)
+                    separator = ',' if labels_text else ''
+                    for bucket, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                        lines.append('{0}_bucket{{{1}{2}le="{3}"}} {4}'.format(
+                            name, labels_text, separator, bucket, bucket_count))
+                    lines.append('{0}_bucket{{{1}{2}le="+Inf"}} {3}'.format(
+                        name, labels_text, separator, histogram.count))
+                    lines.append('{0}_sum{{{1}}} {2}'.format(name, labels_text, histogram.sum))
+                    lines.append('{0}_count{{{1}}} {2}'.format(name, labels_text, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+registry = HistogramRegistry()
+
+
+def start_request_timings():
+    request_timings.stages = OrderedDict()
+    request_timings.queries_count = 0
+    request_timings.queries_time = 0.0
+
+
+def stop_request_timings():
+    stages = getattr(request_timings, 'stages', None)
+    request_timings.stages = None
+    return stages
+
+
+@contextmanager
+def measure(stage):
+    """Measure time of the stage of the current request.
+
+    Does nothing if timings of the request are not collected (MetricsMiddleware is off).
+
+    :param stage: name of the stage, e.g. query, markers, folium, render
+    :type: string
+    """
+    stages = getattr(request_timings, 'stages', None)
+    if stages is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - started_at
+
+
+def count_query(execute, sql, params, many, context):
+    """Database execute wrapper which counts queries of the current request and their time."""
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if getattr(request_timings, 'stages', None) is not None:
+            request_timings.queries_count += 1
+            request_timings.queries_time += time.perf_counter() - started_at
+
+
+def export_metrics():
+    """Give histograms and map cache counters in Prometheus text format.
+
+    :return: text in Prometheus exposition format
+    :type: string
+    """
+    map_cache_stats = get_map_cache_stats()
+    return registry.export() + (
+        '# TYPE pogomap_map_cache_hits_total counter\n'
+        'pogomap_map_cache_hits_total {hits}\n'
+        '# TYPE pogomap_map_cache_misses_total counter\n'
+        'pogomap_map_cache_misses_total {misses}\n'
+    ).format(**map_cache_stats)
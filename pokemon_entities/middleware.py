@@ -0,0 +1,47 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from pokemon_entities import metrics
+
+
+class MetricsMiddleware:
+    """Collect timings and number of SQL queries of every request.
+
+    Timings are put to histograms labeled by URL name of the view and to the Server-Timing
+    header of the response, e.g. 'db;dur=3.1;desc="4 queries", folium;dur=25.0, total;dur=40.2'.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started_at = time.perf_counter()
+        metrics.start_request_timings()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.count_query))
+                response = self.get_response(request)
+            queries_count = metrics.request_timings.queries_count
+            queries_time = metrics.request_timings.queries_time
+        finally:
+            stages = metrics.stop_request_timings()
+        total_time = time.perf_counter() - started_at
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        view = resolver_match.url_name if resolver_match and resolver_match.url_name else 'other'
+        labels = {'view': view}
+        metrics.registry.observe('pogomap_request_seconds', labels, total_time)
+        metrics.registry.observe('pogomap_request_queries', labels, queries_count, metrics.QUERIES_BUCKETS)
+        metrics.registry.observe('pogomap_request_db_seconds', labels, queries_time)
+        for stage, stage_time in stages.items():
+            metrics.registry.observe('pogomap_view_stage_seconds', dict(labels, stage=stage), stage_time)
+
+        server_timing = ['db;dur={0:.1f};desc="{1} queries"'.format(queries_time * 1000, queries_count)]
+        server_timing.extend('{0};dur={1:.1f}'.format(stage, stage_time * 1000)
+                             for stage, stage_time in stages.items())
+        server_timing.append('total;dur={0:.1f}'.format(total_time * 1000))
+        response['Server-Timing'] = ', '.join(server_timing)
+        return response
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.3 on 2026-10-18 10:12
+
+import math
+
+from django.db import migrations, models
+
+
+# tile key as it was defined when this migration was written, later changes of geo.py
+# must not change what the migration does
+TILE_KEY_ZOOM = 16
+MAX_LATITUDE = 85.0511287798
+FILL_CHUNK_SIZE = 1000
+
+
+def get_tile_key(lat, lon):
+    tiles_count = 1 << TILE_KEY_ZOOM
+    lat = min(max(lat, -MAX_LATITUDE), MAX_LATITUDE)
+    lat_rad = math.radians(lat)
+    x = (lon + 180.0) / 360.0 * tiles_count
+    y = (1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * tiles_count
+    x = min(max(int(x), 0), tiles_count - 1)
+    y = min(max(int(y), 0), tiles_count - 1)
+    code = 0
+    for bit in range(TILE_KEY_ZOOM):
+        code |= ((x >> bit) & 1) << (2 * bit)
+        code |= ((y >> bit) & 1) << (2 * bit + 1)
+    return code
+
+
+def fill_tile_keys(apps, schema_editor):
+    PokemonEntity = apps.get_model('pokemon_entities', 'PokemonEntity')
+    pokemon_entities = PokemonEntity.objects.only('id', 'latitude', 'longitude').order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(pokemon_entities.filter(id__gt=last_id)[:FILL_CHUNK_SIZE])
+        if not chunk:
+            break
+        for pokemon_entity in chunk:
+            pokemon_entity.tile_key = get_tile_key(pokemon_entity.latitude, pokemon_entity.longitude)
+        PokemonEntity.objects.bulk_update(chunk, ['tile_key'])
+        last_id = chunk[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon_entities', '0017_auto_20190822_0949'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pokemonentity',
+            name='tile_key',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Тайл'),
+        ),
+        migrations.RunPython(fill_tile_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.3 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon_entities', '0018_pokemonentity_tile_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pokemonentity',
+            index=models.Index(fields=['disappear_at', 'appear_at'], name='entity_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemonentity',
+            index=models.Index(fields=['pokemon', 'disappear_at', 'appear_at'], name='entity_pokemon_active_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.3 on 2026-10-18 12:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon_entities', '0019_auto_20261018_1047'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PokemonEntityArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_id', models.IntegerField(db_index=True, verbose_name='ID особи')),
+                ('latitude', models.FloatField(verbose_name='Ширина')),
+                ('longitude', models.FloatField(verbose_name='Долгота')),
+                ('appear_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Появится в')),
+                ('disappear_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Пропадет в')),
+                ('level', models.IntegerField(blank=True, default=0, verbose_name='Уровень')),
+                ('health', models.IntegerField(blank=True, default=0, verbose_name='Здоровье')),
+                ('strength', models.IntegerField(blank=True, default=0, verbose_name='Атака')),
+                ('defence', models.IntegerField(blank=True, default=0, verbose_name='Защита')),
+                ('stamina', models.IntegerField(blank=True, default=0, verbose_name='Выносливость')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Перемещён в архив')),
+                ('pokemon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pokemon_entities.Pokemon', verbose_name='Покемон')),
+            ],
+        ),
+    ]
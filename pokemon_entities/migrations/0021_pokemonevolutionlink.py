@@ -0,0 +1,52 @@
+# Generated by Django 2.2.3 on 2026-10-18 13:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+
+# closure as it was defined when this migration was written, later changes of evolutions.py
+# must not change what the migration does
+def get_closure(previous_evolutions):
+    closure = {}
+    for pokemon_id in previous_evolutions:
+        ancestor_id = pokemon_id
+        depth = 0
+        while ancestor_id is not None and (ancestor_id, pokemon_id) not in closure:
+            closure[(ancestor_id, pokemon_id)] = depth
+            ancestor_id = previous_evolutions.get(ancestor_id)
+            depth += 1
+    return closure
+
+
+def fill_evolution_links(apps, schema_editor):
+    Pokemon = apps.get_model('pokemon_entities', 'Pokemon')
+    PokemonEvolutionLink = apps.get_model('pokemon_entities', 'PokemonEvolutionLink')
+    closure = get_closure(dict(Pokemon.objects.values_list('id', 'previous_evolution_id')))
+    PokemonEvolutionLink.objects.bulk_create([
+        PokemonEvolutionLink(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+        for (ancestor_id, descendant_id), depth in closure.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon_entities', '0020_pokemonentityarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PokemonEvolutionLink',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(verbose_name='Число эволюций между ними')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='pokemon_entities.Pokemon', verbose_name='Предок')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='pokemon_entities.Pokemon', verbose_name='Потомок')),
+            ],
+            options={
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(fill_evolution_links, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.3 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon_entities', '0021_pokemonevolutionlink'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pokemon',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='Хэш картинки'),
+        ),
+        migrations.AddField(
+            model_name='pokemonelementtype',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='Хэш картинки'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 2.2.3 on 2026-10-18 15:10
+
+import math
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+# tile keys and rollup keys as they were defined when this migration was written, later
+# changes of geo.py and heatmap.py must not change what the migration does
+TILE_KEY_ZOOM = 16
+MAX_LATITUDE = 85.0511287798
+HEATMAP_CELL_SHIFT = 2
+
+
+def get_tile_key(lat, lon):
+    tiles_count = 1 << TILE_KEY_ZOOM
+    lat = min(max(lat, -MAX_LATITUDE), MAX_LATITUDE)
+    lat_rad = math.radians(lat)
+    x = (lon + 180.0) / 360.0 * tiles_count
+    y = (1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * tiles_count
+    x = min(max(int(x), 0), tiles_count - 1)
+    y = min(max(int(y), 0), tiles_count - 1)
+    code = 0
+    for bit in range(TILE_KEY_ZOOM):
+        code |= ((x >> bit) & 1) << (2 * bit)
+        code |= ((y >> bit) & 1) << (2 * bit + 1)
+    return code
+
+
+def count_spawns(spawns):
+    return Counter(
+        (pokemon_id, tile_key >> HEATMAP_CELL_SHIFT,
+         appear_at.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0))
+        for pokemon_id, tile_key, appear_at in spawns
+        if appear_at is not None
+    )
+
+
+def fill_spawn_rollup(apps, schema_editor):
+    PokemonEntity = apps.get_model('pokemon_entities', 'PokemonEntity')
+    PokemonEntityArchive = apps.get_model('pokemon_entities', 'PokemonEntityArchive')
+    PokemonSpawnRollup = apps.get_model('pokemon_entities', 'PokemonSpawnRollup')
+    counts = count_spawns(
+        PokemonEntity.objects.values_list('pokemon_id', 'tile_key', 'appear_at').iterator())
+    counts.update(count_spawns(
+        (pokemon_id, get_tile_key(latitude, longitude), appear_at)
+        for pokemon_id, latitude, longitude, appear_at in PokemonEntityArchive.objects.values_list(
+            'pokemon_id', 'latitude', 'longitude', 'appear_at').iterator()
+    ))
+    PokemonSpawnRollup.objects.bulk_create([
+        PokemonSpawnRollup(pokemon_id=pokemon_id, cell=cell, hour=hour, count=count)
+        for (pokemon_id, cell, hour), count in counts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon_entities', '0022_auto_20261018_1405'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PokemonSpawnRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cell', models.BigIntegerField(verbose_name='Ячейка')),
+                ('hour', models.DateTimeField(verbose_name='Час')),
+                ('count', models.IntegerField(default=0, verbose_name='Число появлений')),
+                ('pokemon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pokemon_entities.Pokemon', verbose_name='Покемон')),
+            ],
+            options={
+                'unique_together': {('pokemon', 'cell', 'hour')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pokemonspawnrollup',
+            index=models.Index(fields=['hour'], name='spawn_rollup_hour_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemonspawnrollup',
+            index=models.Index(fields=['pokemon', 'hour'], name='spawn_rollup_pokemon_hour_idx'),
+        ),
+        migrations.RunPython(fill_spawn_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.3 on 2026-10-18 18:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon_entities', '0024_auto_20261018_1620'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pokemonentity',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='Изменён'),
+            preserve_default=False,
+        ),
+    ]
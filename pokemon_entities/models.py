@@ -1,5 +1,18 @@
+import math
+
+from django.db import connections
 from django.db import models
+from django.db import router
+from django.db.models import ExpressionWrapper
+from django.db.models import F
+from django.db.models import FloatField
+from django.db.models import Q
+from django.utils import timezone
+
+from pokemon_entities import geo
+
 
+DELETE_BATCH_SIZE = 500
 
 class PokemonElementType(models.Model):
     """The PokemonElementType object contains pokemon element types and their characteristic features.
@@ -15,8 +28,11 @@ class PokemonElementType(models.Model):
     title = models.CharField('Название', max_length=200)
     image = models.ImageField('Картинка', blank=True,
                               null=True, upload_to="elements")
+    image_hash = models.CharField(
+        'Хэш картинки', max_length=40, blank=True, default="", editable=False)
     strong_against = models.ManyToManyField(
         "PokemonElementType", verbose_name='Силён против', blank=True)
+    updated_at = models.DateTimeField('Изменён', auto_now=True)
 
     def __str__(self):
         return "{title}".format(title=self.title)
@@ -42,10 +58,13 @@ class Pokemon(models.Model):
         'Имя (яп.)', max_length=200, blank=True, default="")
     description = models.TextField('Описание', blank=True, default="")
     image = models.ImageField('Картинка', blank=True, null=True)
+    image_hash = models.CharField(
+        'Хэш картинки', max_length=40, blank=True, default="", editable=False)
     element_type = models.ManyToManyField(PokemonElementType, blank=True)
     previous_evolution = models.ForeignKey(
         "Pokemon", on_delete=models.SET_NULL, verbose_name='Из кого эволюционировал',
         blank=True, null=True, related_name="next_evolution")
+    updated_at = models.DateTimeField('Изменён', auto_now=True)
 
     def __str__(self):
         return "{title}".format(
@@ -53,6 +72,155 @@ class Pokemon(models.Model):
         )
 
 
+class PokemonEvolutionLink(models.Model):
+    """The PokemonEvolutionLink object links pokemon specie with its evolution of any depth.
+
+    The PokemonEvolutionLink model is the closure table of relation previous_evolution of
+    Pokemon model: there is a link for every pair (ancestor, descendant) where descendant
+    evolves from ancestor in depth steps, including link of every specie to itself with
+    depth 0. So the whole evolution chain of specie is got by one query. Links are rebuilt
+    by signals when previous_evolution changes.
+    """
+
+    ancestor = models.ForeignKey(
+        Pokemon, verbose_name='Предок', on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(
+        Pokemon, verbose_name='Потомок', on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField('Число эволюций между ними')
+
+    class Meta:
+        unique_together = [['ancestor', 'descendant']]
+
+    def __str__(self):
+        return "{ancestor}->{descendant}({depth})".format(
+            ancestor=self.ancestor_id, descendant=self.descendant_id, depth=self.depth
+        )
+
+
+class PokemonEntityQuerySet(models.QuerySet):
+    """The PokemonEntityQuerySet contains location lookups of pokemon entities.
+
+    Location lookups use the indexed tile_key field to narrow the search down to several ranges 
+    of tiles and then check exact coordinates only for entities from these tiles. Time lookups
+    use the indexes on (disappear_at, appear_at) and (pokemon, disappear_at, appear_at).
+    """
+
+    def active(self, at=None):
+        """Give pokemon entities which are on the map at the moment.
+
+        :param at: the moment, current time if None
+        :type: datetime
+        :return: filtered queryset
+        :type: PokemonEntityQuerySet
+        """
+        if at is None:
+            at = timezone.now()
+        return self.filter(disappear_at__gte=at, appear_at__lte=at)
+
+    def in_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        """Give pokemon entities inside of bounding box.
+
+        If min_lon is greater than max_lon, the bounding box crosses the antimeridian.
+
+        :param min_lon: west border of the bounding box
+        :type: float
+        :param min_lat: south border of the bounding box
+        :type: float
+        :param max_lon: east border of the bounding box
+        :type: float
+        :param max_lat: north border of the bounding box
+        :type: float
+        :return: filtered queryset
+        :type: PokemonEntityQuerySet
+        """
+        if min_lon > max_lon:
+            return self.in_bbox(min_lon, min_lat, 180.0, max_lat) | self.in_bbox(-180.0, min_lat, max_lon, max_lat)
+
+        tiles_filter = Q()
+        for start, stop in geo.get_tile_key_ranges(min_lon, min_lat, max_lon, max_lat):
+            tiles_filter |= Q(tile_key__gte=start, tile_key__lt=stop)
+        return self.filter(tiles_filter).filter(
+            latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+
+    def in_tile(self, x, y, zoom):
+        """Give pokemon entities inside of Web Mercator tile.
+
+        Tile of zoom up to TILE_KEY_ZOOM is exactly one range of tile keys, tiles of deeper
+        zoom levels are looked up as bounding boxes.
+
+        :param x: x coordinate of the tile
+        :type: int
+        :param y: y coordinate of the tile
+        :type: int
+        :param zoom: zoom level of the tile
+        :type: int
+        :return: filtered queryset
+        :type: PokemonEntityQuerySet
+        """
+        if zoom <= geo.TILE_KEY_ZOOM:
+            start, stop = geo.get_tile_key_range(x, y, zoom)
+            return self.filter(tile_key__gte=start, tile_key__lt=stop)
+        max_lat, min_lon = geo.tile_to_latlon(x, y, zoom)
+        min_lat, max_lon = geo.tile_to_latlon(x + 1, y + 1, zoom)
+        return self.in_bbox(min_lon, min_lat, max_lon, max_lat)
+
+    def near(self, lat, lon, radius_m):
+        """Give pokemon entities not farther than radius_m meters from the point, nearest first.
+
+        Distance is calculated by equirectangular approximation, which is precise enough for
+        distances inside of one city, and is available as distance_sq (square of distance in meters).
+
+        :param lat: latitude of the point
+        :type: float
+        :param lon: longitude of the point
+        :type: float
+        :param radius_m: search radius in meters
+        :type: float
+        :return: filtered queryset ordered by distance
+        :type: PokemonEntityQuerySet
+        """
+        meters_per_lon_degree = geo.METERS_PER_DEGREE * math.cos(math.radians(lat))
+        delta_lat = (F('latitude') - lat) * geo.METERS_PER_DEGREE
+        delta_lon = (F('longitude') - lon) * meters_per_lon_degree
+        return self.in_bbox(*geo.get_radius_bbox(lat, lon, radius_m)).annotate(
+            distance_sq=ExpressionWrapper(
+                delta_lat * delta_lat + delta_lon * delta_lon, output_field=FloatField())
+        ).filter(distance_sq__lte=radius_m ** 2).order_by('distance_sq')
+
+    def nearest(self, lat, lon, count=10, pokemon_id=None, min_stats=None):
+        """Give count active pokemon entities nearest to the point, nearest first.
+
+        Entities are found by the in-memory index of active spawns (see nearest.py) and then 
+        loaded by this queryset, so other filters of the queryset may reduce number of results.
+        Distance in meters is available as distance_m attribute.
+
+        :param lat: latitude of the point
+        :type: float
+        :param lon: longitude of the point
+        :type: float
+        :param count: number of entities to find
+        :type: int
+        :param pokemon_id: id of pokemon specie to find, any specie if None
+        :type: int
+        :param min_stats: min values of level, health, strength, defence and stamina, e.g. {'level': 10}
+        :type: dict
+        :return: list of pokemon entities
+        :type: list
+        """
+        # nearest.py imports this module
+        from pokemon_entities.nearest import get_spawn_index
+
+        found = get_spawn_index().query(lat, lon, count, timezone.now(), pokemon_id, min_stats)
+        entities_by_id = self.in_bulk([entity_id for entity_id, distance_m in found])
+        nearest_entities = []
+        for entity_id, distance_m in found:
+            if entity_id in entities_by_id:
+                entity = entities_by_id[entity_id]
+                entity.distance_m = distance_m
+                nearest_entities.append(entity)
+        return nearest_entities
+
+
 class PokemonEntity(models.Model):
     """The PokemonEntity object contains pokemons entities and their characteristic features.
 
@@ -79,8 +247,112 @@ class PokemonEntity(models.Model):
     strength = models.IntegerField('Атака', blank=True, default=0)
     defence = models.IntegerField('Защита', blank=True, default=0)
     stamina = models.IntegerField('Выносливость', blank=True, default=0)
+    tile_key = models.BigIntegerField(
+        'Тайл', db_index=True, default=0, editable=False)
+    updated_at = models.DateTimeField('Изменён', auto_now=True, db_index=True)
+
+    objects = PokemonEntityQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['disappear_at', 'appear_at'],
+                         name='entity_active_idx'),
+            models.Index(fields=['pokemon', 'disappear_at', 'appear_at'],
+                         name='entity_pokemon_active_idx'),
+        ]
 
     def __str__(self):
         return "{pok}({lat};{lon})".format(
             pok=self.pokemon.title, lat=self.latitude, lon=self.longitude
         )
+
+    def save(self, *args, **kwargs):
+        self.tile_key = geo.get_tile_key(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'tile_key'}
+        super().save(*args, **kwargs)
+
+
+def delete_entities_by_ids(entity_ids, batch_size=DELETE_BATCH_SIZE):
+    """Delete pokemon entities by ids from the primary database without loading them.
+
+    Rows are deleted by plain DELETE queries, so post_delete signals are not sent: callers must
+    update spawn heatmaps and call invalidate_entities() themselves if the entities were on maps.
+    Ids are sent by batches, as databases limit number of query parameters.
+
+    :param entity_ids: ids of pokemon entities
+    :type: list
+    :param batch_size: max number of ids in one query
+    :type: int
+    :return: number of deleted entities
+    :type: int
+    """
+    connection = connections[router.db_for_write(PokemonEntity)]
+    sql = 'DELETE FROM {table} WHERE {pk} IN ({{params}})'.format(
+        table=connection.ops.quote_name(PokemonEntity._meta.db_table),
+        pk=connection.ops.quote_name(PokemonEntity._meta.pk.column),
+    )
+    deleted_count = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(entity_ids), batch_size):
+            batch = list(entity_ids[start:start + batch_size])
+            cursor.execute(sql.format(params=', '.join(['%s'] * len(batch))), batch)
+            deleted_count += cursor.rowcount
+    return deleted_count
+
+
+class PokemonEntityArchive(models.Model):
+    """The PokemonEntityArchive object contains pokemon entities which have disappeared.
+
+    Expired pokemon entities are moved here by command prune_spawns, so the table of
+    PokemonEntity contains only current and upcoming entities.
+    """
+
+    entity_id = models.IntegerField('ID особи', db_index=True)
+    pokemon = models.ForeignKey(
+        Pokemon, verbose_name='Покемон', on_delete=models.CASCADE)
+    latitude = models.FloatField('Ширина')
+    longitude = models.FloatField('Долгота')
+    appear_at = models.DateTimeField(
+        'Появится в', blank=True, default=None, null=True)
+    disappear_at = models.DateTimeField(
+        'Пропадет в', blank=True, default=None, null=True)
+    level = models.IntegerField('Уровень', blank=True, default=0)
+    health = models.IntegerField('Здоровье', blank=True, default=0)
+    strength = models.IntegerField('Атака', blank=True, default=0)
+    defence = models.IntegerField('Защита', blank=True, default=0)
+    stamina = models.IntegerField('Выносливость', blank=True, default=0)
+    archived_at = models.DateTimeField('Перемещён в архив', auto_now_add=True)
+
+    def __str__(self):
+        return "{pok_id}({lat};{lon})".format(
+            pok_id=self.pokemon_id, lat=self.latitude, lon=self.longitude
+        )
+
+
+class PokemonSpawnRollup(models.Model):
+    """The PokemonSpawnRollup object contains number of spawns of pokemon specie in a cell per hour.
+
+    A cell is Web Mercator tile of zoom heatmap.HEATMAP_CELL_ZOOM, spawn is counted in the hour of
+    its appear_at. Rows are updated on every write of pokemon entities (see heatmap.py), and are
+    not changed when expired entities are archived, so heatmaps cover the whole history.
+    """
+
+    pokemon = models.ForeignKey(
+        Pokemon, verbose_name='Покемон', on_delete=models.CASCADE)
+    cell = models.BigIntegerField('Ячейка')
+    hour = models.DateTimeField('Час')
+    count = models.IntegerField('Число появлений', default=0)
+
+    class Meta:
+        unique_together = [('pokemon', 'cell', 'hour')]
+        indexes = [
+            models.Index(fields=['hour'], name='spawn_rollup_hour_idx'),
+            models.Index(fields=['pokemon', 'hour'], name='spawn_rollup_pokemon_hour_idx'),
+        ]
+
+    def __str__(self):
+        return "{pok_id}({cell};{hour})".format(
+            pok_id=self.pokemon_id, cell=self.cell, hour=self.hour
+        )
@@ -0,0 +1,120 @@
+"""Encoder of Mapbox Vector Tiles (specification 2.1) with point features.
+
+Only what is needed for points is implemented, and protobuf messages are written by hand,
+so no extra packages are required. Field numbers are taken from vector_tile.proto.
+"""
+
+import struct
+
+
+MVT_VERSION = 2
+MVT_EXTENT = 4096
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_BYTES = 2
+
+GEOMETRY_POINT = 1
+COMMAND_MOVE_TO = 1
+
+
+def encode_varint(value):
+    """Give protobuf varint of non-negative integer."""
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def encode_zigzag(value):
+    """Give zigzag code of signed integer, so small negative numbers have short varints."""
+    return (value << 1) ^ (value >> 63)
+
+
+def encode_field(field, wire_type, payload):
+    """Give protobuf field, payload is already encoded value of the field."""
+    return encode_varint((field << 3) | wire_type) + payload
+
+
+def encode_bytes_field(field, data):
+    """Give length-delimited protobuf field (string, message or packed numbers)."""
+    return encode_field(field, WIRE_BYTES, encode_varint(len(data)) + data)
+
+
+def encode_packed_field(field, values):
+    """Give packed repeated field of unsigned integers."""
+    return encode_bytes_field(field, b''.join(encode_varint(value) for value in values))
+
+
+def encode_value(value):
+    """Give Value message of the vector tile layer.
+
+    :param value: value of feature property
+    :type: string, float or int
+    :return: encoded message
+    :type: bytes
+    """
+    if isinstance(value, str):
+        return encode_bytes_field(1, value.encode('utf-8'))
+    if isinstance(value, float):
+        return encode_field(3, WIRE_FIXED64, struct.pack('<d', value))
+    if value >= 0:
+        return encode_field(5, WIRE_VARINT, encode_varint(value))
+    return encode_field(6, WIRE_VARINT, encode_varint(encode_zigzag(value)))
+
+
+def encode_layer(name, features, extent=MVT_EXTENT):
+    """Give Layer message with point features.
+
+    :param name: name of the layer
+    :type: string
+    :param features: tuples (id or None, x, y, properties), x and y are coordinates inside
+                     of the tile from 0 to extent, properties is dict without None values
+    :type: list
+    :param extent: size of the tile in its coordinates
+    :type: int
+    :return: encoded message
+    :type: bytes
+    """
+    keys = {}
+    values = {}
+    encoded_features = []
+    for feature_id, x, y, properties in features:
+        tags = []
+        for key, value in properties.items():
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        geometry = [COMMAND_MOVE_TO | (1 << 3), encode_zigzag(x), encode_zigzag(y)]
+        encoded_feature = b''
+        if feature_id is not None:
+            encoded_feature += encode_field(1, WIRE_VARINT, encode_varint(feature_id))
+        encoded_feature += (encode_packed_field(2, tags)
+                            + encode_field(3, WIRE_VARINT, encode_varint(GEOMETRY_POINT))
+                            + encode_packed_field(4, geometry))
+        encoded_features.append(encode_bytes_field(2, encoded_feature))
+
+    return b''.join([
+        encode_field(15, WIRE_VARINT, encode_varint(MVT_VERSION)),
+        encode_bytes_field(1, name.encode('utf-8')),
+        b''.join(encoded_features),
+        b''.join(encode_bytes_field(3, key.encode('utf-8')) for key in keys),
+        b''.join(encode_bytes_field(4, encode_value(value)) for value_type, value in values),
+        encode_field(5, WIRE_VARINT, encode_varint(extent)),
+    ])
+
+
+def encode_tile(layers):
+    """Give Tile message made of encoded layers, empty layers are skipped.
+
+    :param layers: list of tuples (name, features), see encode_layer()
+    :type: list
+    :return: the vector tile
+    :type: bytes
+    """
+    return b''.join(encode_bytes_field(3, encode_layer(name, features))
+                    for name, features in layers if features)
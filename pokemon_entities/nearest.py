@@ -0,0 +1,209 @@
+"""Search of the nearest active pokemon entities.
+
+The index is a KD-tree over positions on the unit sphere of entities of the spawn snapshot
+(see snapshot.py), which keeps active and upcoming entities in NumPy arrays of the process.
+Entities appear and expire without rebuilding: the index checks appear_at and disappear_at of
+every entity at query time. The tree is built again only when rows of the snapshot have changed,
+so the index itself never reads the database.
+
+The tree ranks entities by chord distance, which grows together with the great-circle distance.
+Distances in the answer are calculated by the haversine formula.
+"""
+
+import heapq
+import threading
+
+import numpy as np
+
+from pokemon_entities import geo
+from pokemon_entities.snapshot import STAT_FIELDS
+from pokemon_entities.snapshot import get_spawn_snapshot
+
+
+KD_TREE_LEAF_SIZE = 64
+BRUTE_FORCE_MAX_CANDIDATES = 4096
+
+spawn_index = None
+spawn_index_lock = threading.Lock()
+
+
+def latlon_to_xyz(lat, lon):
+    """Give points on the unit sphere for coordinates (scalars or arrays) in degrees."""
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def get_haversine_distances(lat, lon, latitudes, longitudes):
+    """Give distances in meters from the point to every point of arrays.
+
+    :param lat: latitude of the point
+    :type: float
+    :param lon: longitude of the point
+    :type: float
+    :param latitudes: latitudes of points
+    :type: ndarray
+    :param longitudes: longitudes of points
+    :type: ndarray
+    :return: distances in meters
+    :type: ndarray
+    """
+    lat = np.radians(lat)
+    latitudes = np.radians(latitudes)
+    delta_lat = latitudes - lat
+    delta_lon = np.radians(longitudes) - np.radians(lon)
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat) * np.cos(latitudes) * np.sin(delta_lon / 2) ** 2
+    return 2 * geo.EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class KDTree:
+    """KD-tree of 3D points.
+
+    Nodes are rows [start, end, left, right]: points of the node are points[order[start:end]],
+    left and right are child nodes, -1 for leaves. Every node has the bounding box of its points.
+    """
+
+    def __init__(self, points, leaf_size=KD_TREE_LEAF_SIZE):
+        self.points = points
+        self.order = np.arange(len(points))
+        self.nodes = []
+        box_min = []
+        box_max = []
+
+        def add_node(start, end):
+            node_points = points[self.order[start:end]]
+            self.nodes.append([start, end, -1, -1])
+            box_min.append(node_points.min(axis=0) if end > start else np.zeros(3))
+            box_max.append(node_points.max(axis=0) if end > start else np.zeros(3))
+            return len(self.nodes) - 1
+
+        stack = [add_node(0, len(points))]
+        while stack:
+            node = stack.pop()
+            start, end = self.nodes[node][:2]
+            if end - start <= leaf_size:
+                continue
+            dimension = int(np.argmax(box_max[node] - box_min[node]))
+            middle = (end - start) // 2
+            node_order = self.order[start:end]
+            self.order[start:end] = node_order[np.argpartition(points[node_order, dimension], middle)]
+            self.nodes[node][2] = add_node(start, start + middle)
+            self.nodes[node][3] = add_node(start + middle, end)
+            stack.extend(self.nodes[node][2:])
+
+        self.box_min = np.array(box_min)
+        self.box_max = np.array(box_max)
+
+    def query(self, point, count, mask):
+        """Give indexes of count points nearest to the point among points where mask is True.
+
+        Nodes are visited in order of distance to their bounding boxes, and the search stops
+        when the nearest unvisited box is farther than the count-th found point.
+
+        :param point: 3D point
+        :type: ndarray
+        :param count: number of points to find
+        :type: int
+        :param mask: which points may be found
+        :type: ndarray
+        :return: indexes of points, nearest first
+        :type: ndarray
+        """
+        best_indexes = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0)
+        heap = [(0.0, 0)]
+        while heap:
+            box_distance, node = heapq.heappop(heap)
+            if len(best_distances) >= count and box_distance >= best_distances[-1]:
+                break
+            start, end, left, right = self.nodes[node]
+            if left >= 0:
+                for child in (left, right):
+                    outside = (np.maximum(self.box_min[child] - point, 0)
+                               + np.maximum(point - self.box_max[child], 0))
+                    heapq.heappush(heap, (float(np.dot(outside, outside)), child))
+                continue
+
+            indexes = self.order[start:end]
+            indexes = indexes[mask[indexes]]
+            if not indexes.size:
+                continue
+            distances = ((self.points[indexes] - point) ** 2).sum(axis=1)
+            best_indexes = np.concatenate([best_indexes, indexes])
+            best_distances = np.concatenate([best_distances, distances])
+            nearest = np.argsort(best_distances, kind='stable')[:count]
+            best_indexes = best_indexes[nearest]
+            best_distances = best_distances[nearest]
+        return best_indexes
+
+
+class SpawnIndex:
+    """KD-tree over positions of pokemon entities of the spawn snapshot."""
+
+    def __init__(self, snapshot):
+        rows = self.rows = snapshot.rows
+        self.ids = rows['id']
+        self.latitudes = rows['latitude']
+        self.longitudes = rows['longitude']
+        self.pokemon_ids = rows['pokemon_id']
+        self.appear_at = rows['appear_at']
+        self.disappear_at = rows['disappear_at']
+        self.stats = {field: rows[field] for field in STAT_FIELDS}
+        self.tree = KDTree(latlon_to_xyz(self.latitudes, self.longitudes).reshape(-1, 3))
+
+    def query(self, lat, lon, count, now, pokemon_id=None, min_stats=None):
+        """Give count nearest to the point pokemon entities which are active at the moment.
+
+        If few entities pass the filters, distances to all of them are calculated at once
+        instead of walking the tree.
+
+        :param lat: latitude of the point
+        :type: float
+        :param lon: longitude of the point
+        :type: float
+        :param count: number of entities to find
+        :type: int
+        :param now: the moment
+        :type: datetime
+        :param pokemon_id: id of pokemon specie to find, any specie if None
+        :type: int
+        :param min_stats: min values of STAT_FIELDS, e.g. {'level': 10}
+        :type: dict
+        :return: list of tuples (id of entity, distance in meters), nearest first
+        :type: list
+        """
+        timestamp = now.timestamp()
+        mask = (self.appear_at <= timestamp) & (self.disappear_at >= timestamp)
+        if pokemon_id is not None:
+            mask &= self.pokemon_ids == pokemon_id
+        for field, min_value in (min_stats or {}).items():
+            mask &= self.stats[field] >= min_value
+
+        if np.count_nonzero(mask) <= BRUTE_FORCE_MAX_CANDIDATES:
+            indexes = np.flatnonzero(mask)
+            distances = get_haversine_distances(lat, lon, self.latitudes[indexes], self.longitudes[indexes])
+            nearest = np.argsort(distances, kind='stable')[:count]
+            indexes = indexes[nearest]
+            distances = distances[nearest]
+        else:
+            indexes = self.tree.query(latlon_to_xyz(lat, lon), count, mask)
+            distances = get_haversine_distances(lat, lon, self.latitudes[indexes], self.longitudes[indexes])
+        return list(zip(self.ids[indexes].tolist(), distances.tolist()))
+
+
+def get_spawn_index():
+    """Give spawn index for the current spawn snapshot.
+
+    :return: spawn index
+    :type: SpawnIndex
+    """
+    global spawn_index
+    snapshot = get_spawn_snapshot()
+    current_index = spawn_index
+    if current_index is not None and current_index.rows is snapshot.rows:
+        return current_index
+    with spawn_index_lock:
+        if spawn_index is None or spawn_index.rows is not snapshot.rows:
+            spawn_index = SpawnIndex(snapshot)
+        return spawn_index
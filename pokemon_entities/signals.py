@@ -0,0 +1,93 @@
+from collections import Counter
+
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from pokemon_entities.catalogue import invalidate_species_catalogue
+from pokemon_entities.evolutions import is_evolution_link_actual
+from pokemon_entities.evolutions import rebuild_evolution_links
+from pokemon_entities.heatmap import add_to_rollup
+from pokemon_entities.heatmap import get_rollup_key
+from pokemon_entities.images import update_derivatives
+from pokemon_entities.map_cache import invalidate_entities
+from pokemon_entities.sprites import build_sprite_sheet
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonElementType
+from pokemon_entities.models import PokemonEntity
+
+
+@receiver(post_save, sender=Pokemon)
+@receiver(post_delete, sender=Pokemon)
+@receiver(post_save, sender=PokemonElementType)
+@receiver(post_delete, sender=PokemonElementType)
+@receiver(m2m_changed, sender=Pokemon.element_type.through)
+@receiver(m2m_changed, sender=PokemonElementType.strong_against.through)
+def on_species_change(sender, **kwargs):
+    """Drop cached species catalogue after any change of species or their element types."""
+    invalidate_species_catalogue()
+
+
+@receiver(post_save, sender=PokemonEntity)
+@receiver(post_delete, sender=PokemonEntity)
+def on_entity_change(sender, instance, **kwargs):
+    """Refresh spawn snapshot of this process after any change of pokemon entity."""
+    invalidate_entities()
+
+
+@receiver(pre_save, sender=PokemonEntity)
+def on_entity_pre_save(sender, instance, **kwargs):
+    """Remember rollup row counting the entity before it is changed."""
+    instance.rollup_key_before_save = None
+    if not instance._state.adding and instance.pk is not None:
+        saved_spawn = PokemonEntity.objects.filter(pk=instance.pk).values_list(
+            'pokemon_id', 'tile_key', 'appear_at').first()
+        if saved_spawn is not None:
+            instance.rollup_key_before_save = get_rollup_key(*saved_spawn)
+
+
+@receiver(post_save, sender=PokemonEntity)
+def on_entity_save(sender, instance, **kwargs):
+    """Move the entity to its new rollup row of spawn heatmaps."""
+    deltas = Counter()
+    old_key = getattr(instance, 'rollup_key_before_save', None)
+    new_key = get_rollup_key(instance.pokemon_id, instance.tile_key, instance.appear_at)
+    if old_key != new_key:
+        if old_key is not None:
+            deltas[old_key] -= 1
+        if new_key is not None:
+            deltas[new_key] += 1
+        add_to_rollup(deltas)
+
+
+@receiver(post_delete, sender=PokemonEntity)
+def on_entity_delete(sender, instance, **kwargs):
+    """Remove deleted entity from spawn heatmaps, archived entities are not removed."""
+    key = get_rollup_key(instance.pokemon_id, instance.tile_key, instance.appear_at)
+    if key is not None:
+        add_to_rollup(Counter({key: -1}))
+
+
+@receiver(post_save, sender=Pokemon)
+def on_pokemon_save(sender, instance, **kwargs):
+    """Rebuild evolution chains if previous evolution of pokemon has changed."""
+    if not is_evolution_link_actual(instance):
+        rebuild_evolution_links()
+
+
+@receiver(post_delete, sender=Pokemon)
+def on_pokemon_delete(sender, **kwargs):
+    """Rebuild evolution chains, deleted pokemon could be an evolution of other ones."""
+    rebuild_evolution_links()
+
+
+@receiver(post_save, sender=Pokemon)
+@receiver(post_save, sender=PokemonElementType)
+def on_image_save(sender, instance, **kwargs):
+    """Make derivatives of uploaded image of pokemon or element type and rebuild sprite sheet."""
+    if update_derivatives(instance):
+        if sender is Pokemon:
+            build_sprite_sheet()
+        invalidate_species_catalogue()
@@ -0,0 +1,258 @@
+"""Live snapshot of active pokemon entities in NumPy arrays.
+
+Map views don't load pokemon entities from the database on every request. Entities which are
+active now or will appear during SNAPSHOT_HORIZON are kept once per process in a structured
+array sorted by id, and views select rows by time, bounding box and specie with vectorized
+comparisons instead of making model instances or dicts for every entity.
+
+The snapshot is refreshed incrementally when the version of pokemon entities is replaced after
+a write of this process (see map_cache.py) and every SNAPSHOT_REFRESH_INTERVAL, so writes of other
+processes are noticed even if the cache is not shared between them. Only entities saved since the
+previous refresh (by updated_at, with SNAPSHOT_SYNC_OVERLAP for transactions committed later than
+their updated_at and for clocks of other servers) and entities which have come into the horizon
+are loaded. Deleted entities leave no rows to load, so the refresh compares count and sum of ids
+of entities in the horizon with the database and loads the whole snapshot again if they differ,
+as it does every SNAPSHOT_RELOAD_INTERVAL. A snapshot read from a replica soon after a write is
+refreshed again when DB_REPLICA_STALENESS has passed.
+"""
+
+import hashlib
+import threading
+from datetime import datetime
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+from django.db.models import Q
+from django.db.models import Sum
+from django.utils import timezone
+
+from pokemon_entities.folium_layers import ENTITY_FIELDS
+from pokemon_entities.map_cache import get_entities_version
+from pokemon_entities.map_cache import get_replica_lag_window
+from pokemon_entities.models import PokemonEntity
+
+
+SNAPSHOT_HORIZON = timedelta(minutes=10)
+SNAPSHOT_REFRESH_INTERVAL = timedelta(seconds=10)
+SNAPSHOT_RELOAD_INTERVAL = timedelta(hours=1)
+SNAPSHOT_SYNC_OVERLAP = timedelta(minutes=1)
+STAT_FIELDS = ['level', 'health', 'strength', 'defence', 'stamina']
+SNAPSHOT_FIELDS = ['id', 'pokemon_id', 'latitude', 'longitude', 'tile_key', 'appear_at', 'disappear_at', *STAT_FIELDS]
+SNAPSHOT_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('pokemon_id', np.int64),
+    ('latitude', np.float64),
+    ('longitude', np.float64),
+    ('tile_key', np.int64),
+    ('appear_at', np.float64),
+    ('disappear_at', np.float64),
+] + [(field, np.int32) for field in STAT_FIELDS])
+
+spawn_snapshot = None
+spawn_snapshot_lock = threading.Lock()
+
+
+def to_snapshot_rows(entities):
+    """Give structured array of pokemon entities, empty appear_at and disappear_at become NaN.
+
+    :param entities: rows of SNAPSHOT_FIELDS values
+    :type: iterable
+    :return: rows of SNAPSHOT_DTYPE
+    :type: ndarray
+    """
+    return np.array([
+        (entity_id, pokemon_id, latitude, longitude, tile_key,
+         appear_at.timestamp() if appear_at else np.nan,
+         disappear_at.timestamp() if disappear_at else np.nan,
+         *stats)
+        for entity_id, pokemon_id, latitude, longitude, tile_key, appear_at, disappear_at, *stats in entities
+    ], dtype=SNAPSHOT_DTYPE)
+
+
+def get_entity_values(rows):
+    """Give rows of ENTITY_FIELDS values with Python numbers, like values_list() of pokemon entities.
+
+    :param rows: rows of spawn snapshot
+    :type: ndarray
+    :return: list of tuples
+    :type: list
+    """
+    return list(zip(*[rows[field].tolist() for field in ENTITY_FIELDS]))
+
+
+def get_rows_digest(rows):
+    """Give digest of rows of spawn snapshot, it changes with any change of the rows.
+
+    :param rows: rows of spawn snapshot
+    :type: ndarray
+    :return: hex digest
+    :type: string
+    """
+    return hashlib.md5(rows.tobytes()).hexdigest()
+
+
+class SpawnSnapshot:
+    """Active and upcoming pokemon entities as structured array sorted by id."""
+
+    def __init__(self, version, synced_at, loaded_at, rows):
+        self.version = version
+        self.synced_at = synced_at
+        self.loaded_at = loaded_at
+        self.horizon_end = synced_at + SNAPSHOT_HORIZON
+        self.expires_at = synced_at + SNAPSHOT_REFRESH_INTERVAL
+        self.rows = rows
+
+    def get_mask(self, bbox=None, pokemon_id=None):
+        """Give which rows lie inside of bounding box and belong to the specie.
+
+        :param bbox: tuple (min_lon, min_lat, max_lon, max_lat), crosses the antimeridian if
+                     min_lon is greater than max_lon, the whole map if None
+        :type: tuple
+        :param pokemon_id: id of pokemon specie, all species if None
+        :type: int
+        :return: mask of rows
+        :type: ndarray
+        """
+        rows = self.rows
+        mask = np.ones(len(rows), dtype=bool)
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            mask &= (rows['latitude'] >= min_lat) & (rows['latitude'] <= max_lat)
+            if min_lon <= max_lon:
+                mask &= (rows['longitude'] >= min_lon) & (rows['longitude'] <= max_lon)
+            else:
+                mask &= (rows['longitude'] >= min_lon) | (rows['longitude'] <= max_lon)
+        if pokemon_id is not None:
+            mask &= rows['pokemon_id'] == pokemon_id
+        return mask
+
+    def select(self, at, bbox=None, pokemon_id=None):
+        """Give rows of pokemon entities which are on the map at the moment, sorted by id.
+
+        :param at: the moment
+        :type: datetime
+        :param bbox: bounding box, see get_mask()
+        :type: tuple
+        :param pokemon_id: id of pokemon specie, all species if None
+        :type: int
+        :return: rows of SNAPSHOT_DTYPE
+        :type: ndarray
+        """
+        timestamp = at.timestamp()
+        mask = self.get_mask(bbox, pokemon_id)
+        mask &= (self.rows['appear_at'] <= timestamp) & (self.rows['disappear_at'] >= timestamp)
+        return self.rows[mask]
+
+    def get_next_boundary(self, now, bbox=None, pokemon_id=None):
+        """Give the nearest moment after now when the set of active entities changes.
+
+        :param now: current time
+        :type: datetime
+        :param bbox: bounding box, see get_mask()
+        :type: tuple
+        :param pokemon_id: id of pokemon specie, all species if None
+        :type: int
+        :return: the nearest appear_at or disappear_at, None if there is no such moment in the horizon
+        :type: datetime
+        """
+        rows = self.rows[self.get_mask(bbox, pokemon_id)]
+        timestamp = now.timestamp()
+        boundaries = np.concatenate([
+            rows['appear_at'][rows['appear_at'] > timestamp],
+            rows['disappear_at'][(rows['appear_at'] <= timestamp) & (rows['disappear_at'] >= timestamp)],
+        ])
+        if not boundaries.size:
+            return None
+        return datetime.fromtimestamp(float(boundaries.min()), tz=timezone.utc)
+
+
+def get_sync_overlap():
+    """Give how long before the previous refresh changed entities are loaded again."""
+    return SNAPSHOT_SYNC_OVERLAP + timedelta(seconds=settings.DB_REPLICA_STALENESS)
+
+
+def limit_by_replica_lag(snapshot, now):
+    """Make snapshot read from a replica expire when the replica can't miss writes anymore."""
+    lag_window = get_replica_lag_window()
+    if lag_window:
+        snapshot.expires_at = min(snapshot.expires_at, now + timedelta(seconds=lag_window))
+    return snapshot
+
+
+def build_spawn_snapshot(version):
+    """Load active and upcoming pokemon entities into spawn snapshot.
+
+    :param version: version of pokemon entities
+    :type: string
+    :return: spawn snapshot
+    :type: SpawnSnapshot
+    """
+    now = timezone.now()
+    entities = PokemonEntity.objects.filter(
+        disappear_at__gte=now, appear_at__lte=now + SNAPSHOT_HORIZON
+    ).order_by('id').values_list(*SNAPSHOT_FIELDS)
+    return limit_by_replica_lag(SpawnSnapshot(version, now, now, to_snapshot_rows(entities)), now)
+
+
+def refresh_spawn_snapshot(snapshot, version):
+    """Give new spawn snapshot made of the snapshot and entities changed since it was synced.
+
+    Changed entities are loaded whatever their time is, so entities which were expired or
+    moved out of the horizon replace their old rows and then are dropped with expired ones.
+    If entities were deleted, the whole snapshot is loaded again.
+
+    :param snapshot: the previous spawn snapshot
+    :type: SpawnSnapshot
+    :param version: version of pokemon entities
+    :type: string
+    :return: spawn snapshot
+    :type: SpawnSnapshot
+    """
+    now = timezone.now()
+    if now - snapshot.loaded_at >= SNAPSHOT_RELOAD_INTERVAL:
+        return build_spawn_snapshot(version)
+    horizon_end = now + SNAPSHOT_HORIZON
+    changed_rows = to_snapshot_rows(PokemonEntity.objects.filter(
+        Q(updated_at__gte=snapshot.synced_at - get_sync_overlap())
+        | Q(disappear_at__gte=now, appear_at__gt=snapshot.horizon_end, appear_at__lte=horizon_end)
+    ).order_by().values_list(*SNAPSHOT_FIELDS))
+    horizon_stats = PokemonEntity.objects.filter(
+        disappear_at__gte=now, appear_at__lte=horizon_end
+    ).order_by().aggregate(count=Count('id'), ids_sum=Sum('id'))
+
+    rows = np.concatenate([snapshot.rows[~np.isin(snapshot.rows['id'], changed_rows['id'])], changed_rows])
+    rows = rows[(rows['disappear_at'] >= now.timestamp()) & (rows['appear_at'] <= horizon_end.timestamp())]
+    if horizon_stats['count'] != len(rows) or (horizon_stats['ids_sum'] or 0) != int(rows['id'].sum()):
+        # entities were deleted or written during the refresh
+        return build_spawn_snapshot(version)
+    if not len(changed_rows) and len(rows) == len(snapshot.rows):
+        # nothing has changed, so structures built on the rows (see nearest.py) stay valid
+        rows = snapshot.rows
+    else:
+        rows = rows[np.argsort(rows['id'], kind='stable')]
+    return limit_by_replica_lag(SpawnSnapshot(version, now, snapshot.loaded_at, rows), now)
+
+
+def get_spawn_snapshot():
+    """Give spawn snapshot for the current version of pokemon entities.
+
+    :return: spawn snapshot
+    :type: SpawnSnapshot
+    """
+    global spawn_snapshot
+    version = get_entities_version()
+    current_snapshot = spawn_snapshot
+    if (current_snapshot is not None and current_snapshot.version == version
+            and current_snapshot.expires_at > timezone.now()):
+        return current_snapshot
+    with spawn_snapshot_lock:
+        now = timezone.now()
+        if spawn_snapshot is not None and spawn_snapshot.version == version and spawn_snapshot.expires_at > now:
+            return spawn_snapshot
+        if spawn_snapshot is None:
+            spawn_snapshot = build_spawn_snapshot(version)
+        else:
+            spawn_snapshot = refresh_spawn_snapshot(spawn_snapshot, version)
+        return spawn_snapshot
@@ -0,0 +1,127 @@
+"""Sprite sheet with icons of all pokemon species.
+
+Icons of species are packed into one PNG image, so the catalogue and map markers load one
+image instead of one per specie. Positions of icons are saved to JSON manifest and CSS next to
+the sheet. Names of the sheet and CSS contain hash of the icons, so they may be cached forever.
+
+Storages can't replace a file atomically, so every manifest is saved under a new name with
+generation number and readers take the newest one. Older manifests are deleted only after the
+new one is saved, so readers always find a manifest while the sheet exists.
+"""
+
+import hashlib
+import io
+import json
+import math
+import re
+import time
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from pokemon_entities.images import DERIVATIVE_SIZES
+from pokemon_entities.images import get_derivative_name
+from pokemon_entities.models import Pokemon
+
+
+SPRITES_DIR = 'sprites'
+SPRITE_MANIFEST_NAME = SPRITES_DIR + '/species.{generation:020d}.json'
+SPRITE_MANIFEST_RE = re.compile(r'^species\.(?P<generation>\d{20})\.json$')
+SPRITE_ICON_SIZE = DERIVATIVE_SIZES['icon']
+
+
+def get_manifest_names():
+    """Give names of saved manifests of the sprite sheet from the oldest to the newest."""
+    try:
+        file_names = default_storage.listdir(SPRITES_DIR)[1]
+    except FileNotFoundError:
+        return []
+    manifest_names = sorted(name for name in file_names if SPRITE_MANIFEST_RE.match(name))
+    return ['{0}/{1}'.format(SPRITES_DIR, name) for name in manifest_names]
+
+
+def delete_manifests(manifest_names):
+    """Delete manifests, ones deleted meanwhile by other process are skipped."""
+    for manifest_name in manifest_names:
+        default_storage.delete(manifest_name)
+
+
+def build_sprite_sheet():
+    """Pack icons of all species with images into the sprite sheet.
+
+    :return: manifest of the sprite sheet, None if no specie has image
+    :type: dict
+    """
+    species = list(Pokemon.objects.exclude(image='').exclude(image=None).order_by('id'))
+    if not species:
+        delete_manifests(get_manifest_names())
+        return None
+    icon_width, icon_height = SPRITE_ICON_SIZE
+    columns = math.ceil(math.sqrt(len(species)))
+    rows = math.ceil(len(species) / columns)
+    sheet = Image.new('RGBA', (columns * icon_width, rows * icon_height), (0, 0, 0, 0))
+
+    positions = {}
+    for index, pokemon in enumerate(species):
+        if pokemon.image_hash:
+            icon_name = get_derivative_name(pokemon.image, pokemon.image_hash, 'icon', 'png')
+        else:
+            icon_name = pokemon.image.name
+        with pokemon.image.storage.open(icon_name, 'rb') as icon_file:
+            icon = Image.open(icon_file)
+            icon.load()
+        icon = icon.convert('RGBA')
+        icon.thumbnail(SPRITE_ICON_SIZE, Image.LANCZOS)
+        x = index % columns * icon_width + (icon_width - icon.width) // 2
+        y = index // columns * icon_height + (icon_height - icon.height) // 2
+        sheet.paste(icon, (x, y))
+        positions[str(pokemon.id)] = [index % columns * icon_width, index // columns * icon_height]
+
+    content = io.BytesIO()
+    sheet.save(content, format='PNG', optimize=True)
+    sheet_hash = hashlib.sha1(content.getvalue()).hexdigest()[:12]
+    sheet_name = '{0}/species.{1}.png'.format(SPRITES_DIR, sheet_hash)
+    if not default_storage.exists(sheet_name):
+        default_storage.save(sheet_name, ContentFile(content.getvalue()))
+    sheet_url = default_storage.url(sheet_name)
+
+    css_rules = ['.pokemon-sprite{{display:inline-block;width:{0}px;height:{1}px;background-image:url({2});}}'.format(
+        icon_width, icon_height, sheet_url)]
+    css_rules.extend('.pokemon-sprite-{0}{{background-position:-{1}px -{2}px;}}'.format(pokemon_id, x, y)
+                     for pokemon_id, (x, y) in positions.items())
+    css = '\n'.join(css_rules) + '\n'
+    css_name = '{0}/species.{1}.css'.format(SPRITES_DIR, hashlib.sha1(css.encode('utf-8')).hexdigest()[:12])
+    if not default_storage.exists(css_name):
+        default_storage.save(css_name, ContentFile(css.encode('utf-8')))
+
+    manifest = {
+        'url': sheet_url,
+        'css_url': default_storage.url(css_name),
+        'icon_size': [icon_width, icon_height],
+        'positions': positions,
+    }
+    manifest_name = default_storage.save(SPRITE_MANIFEST_NAME.format(generation=int(time.time() * 1000000)),
+                                         ContentFile(json.dumps(manifest).encode('utf-8')))
+    delete_manifests([name for name in get_manifest_names() if name < manifest_name])
+    return manifest
+
+
+def read_sprite_manifest():
+    """Give manifest of the sprite sheet.
+
+    :return: dict with keys url, css_url, icon_size and positions (dict like {pokemon_id: [x, y]}),
+             None if the sprite sheet is not built
+    :type: dict
+    """
+    for _ in range(2):
+        manifest_names = get_manifest_names()
+        if not manifest_names:
+            return None
+        try:
+            with default_storage.open(manifest_names[-1], 'rb') as manifest_file:
+                return json.loads(manifest_file.read().decode('utf-8'))
+        except FileNotFoundError:
+            # the manifest was replaced by a newer one meanwhile
+            continue
+    return None
@@ -0,0 +1,79 @@
+import re
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+from django.test import override_settings
+
+from pokemon_entities import metrics
+
+
+SAMPLE_RE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?P<labels>[^}]*)\})? (?P<value>\S+)$')
+HISTOGRAM_SUFFIXES = ['_bucket', '_sum', '_count']
+
+
+def parse_families(text):
+    """Parse Prometheus text format into {family: [(sample name, labels, value)]}.
+
+    Fails like the Prometheus parser does if samples of a family are not one block under
+    its TYPE line.
+    """
+    families = {}
+    family = None
+    for line in text.splitlines():
+        if not line:
+            continue
+        if line.startswith('# TYPE '):
+            family, family_type = line[len('# TYPE '):].split(' ')
+            if family in families:
+                raise ValueError('Second TYPE line of {0}'.format(family))
+            families[family] = []
+            continue
+        match = SAMPLE_RE.match(line)
+        if match is None:
+            raise ValueError('Malformed line: {0}'.format(line))
+        name = match.group('name')
+        base_name = name
+        for suffix in HISTOGRAM_SUFFIXES:
+            if name.endswith(suffix) and name[:-len(suffix)] == family:
+                base_name = family
+        if base_name != family:
+            raise ValueError('Sample {0} is outside of its family block'.format(name))
+        families[family].append((name, match.group('labels') or '', float(match.group('value'))))
+    return families
+
+
+@override_settings(MIDDLEWARE=['pokemon_entities.middleware.MetricsMiddleware'] + settings.MIDDLEWARE)
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(metrics, 'registry', metrics.HistogramRegistry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_families_are_not_split_by_views(self):
+        self.client.get('/api/entities/', {'bbox': '37.5,55.7,37.7,55.8', 'zoom': 16})
+        self.client.get('/api/heatmap/')
+        self.client.get('/api/entities/', {'bbox': '37.5,55.7,37.7,55.8', 'zoom': 16})
+
+        response = self.client.get('/metrics/')
+
+        self.assertEqual(response.status_code, 200)
+        families = parse_families(response.content.decode('utf-8'))
+        for family in ['pogomap_request_seconds', 'pogomap_request_queries', 'pogomap_request_db_seconds']:
+            counts = {labels: value for name, labels, value in families[family] if name == family + '_count'}
+            self.assertEqual(counts, {'view="api_entities"': 2, 'view="api_heatmap"': 1})
+
+    def test_histogram_buckets_are_cumulative(self):
+        metrics.registry.observe('test_seconds', {'view': 'a'}, 0.02)
+        metrics.registry.observe('test_seconds', {'view': 'b'}, 3)
+        metrics.registry.observe('test_seconds', {'view': 'a'}, 0.2)
+
+        samples = parse_families(metrics.registry.export())['test_seconds']
+
+        buckets = {labels: value for name, labels, value in samples if name == 'test_seconds_bucket'}
+        self.assertEqual(buckets['view="a",le="0.025"'], 1)
+        self.assertEqual(buckets['view="a",le="0.25"'], 2)
+        self.assertEqual(buckets['view="a",le="+Inf"'], 2)
+        self.assertEqual(buckets['view="b",le="2.5"'], 0)
+        self.assertEqual(buckets['view="b",le="+Inf"'], 1)
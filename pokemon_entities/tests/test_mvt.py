@@ -0,0 +1,141 @@
+import struct
+from unittest import TestCase
+
+from pokemon_entities.mvt import MVT_EXTENT
+from pokemon_entities.mvt import encode_tile
+
+
+def decode_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def decode_zigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_message(data):
+    """Give fields of protobuf message as list of (field number, value).
+
+    Values of length-delimited fields are bytes, of fixed64 fields are 8 bytes.
+    """
+    fields = []
+    position = 0
+    while position < len(data):
+        key, position = decode_varint(data, position)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = decode_varint(data, position)
+        elif wire_type == 1:
+            value, position = data[position:position + 8], position + 8
+        elif wire_type == 2:
+            length, position = decode_varint(data, position)
+            value, position = data[position:position + length], position + length
+        else:
+            raise ValueError('Unexpected wire type {0}'.format(wire_type))
+        fields.append((field, value))
+    return fields
+
+
+def decode_packed(data):
+    values = []
+    position = 0
+    while position < len(data):
+        value, position = decode_varint(data, position)
+        values.append(value)
+    return values
+
+
+def decode_value(data):
+    field, value = decode_message(data)[0]
+    if field == 1:
+        return value.decode('utf-8')
+    if field == 3:
+        return struct.unpack('<d', value)[0]
+    if field == 5:
+        return value
+    if field == 6:
+        return decode_zigzag(value)
+    raise ValueError('Unexpected value field {0}'.format(field))
+
+
+def decode_tile(data):
+    """Give layers of vector tile as {name: {'version', 'extent', 'features'}} like vector_tile.proto."""
+    layers = {}
+    for field, layer_data in decode_message(data):
+        assert field == 3
+        layer = {'features': []}
+        keys = []
+        values = []
+        raw_features = []
+        for layer_field, value in decode_message(layer_data):
+            if layer_field == 1:
+                name = value.decode('utf-8')
+            elif layer_field == 2:
+                raw_features.append(value)
+            elif layer_field == 3:
+                keys.append(value.decode('utf-8'))
+            elif layer_field == 4:
+                values.append(decode_value(value))
+            elif layer_field == 5:
+                layer['extent'] = value
+            elif layer_field == 15:
+                layer['version'] = value
+        for raw_feature in raw_features:
+            feature = {'id': None}
+            for feature_field, value in decode_message(raw_feature):
+                if feature_field == 1:
+                    feature['id'] = value
+                elif feature_field == 2:
+                    tags = decode_packed(value)
+                    feature['properties'] = {keys[tags[index]]: values[tags[index + 1]]
+                                             for index in range(0, len(tags), 2)}
+                elif feature_field == 3:
+                    feature['type'] = value
+                elif feature_field == 4:
+                    command, x, y = decode_packed(value)
+                    feature['command'] = command
+                    feature['point'] = (decode_zigzag(x), decode_zigzag(y))
+            layer['features'].append(feature)
+        layers[name] = layer
+    return layers
+
+
+class EncodeTileTest(TestCase):
+
+    def test_tile_is_decoded_back(self):
+        content = encode_tile([
+            ('entities', [
+                (300, 10, 4000, {'pokemon_id': 25, 'level': 0, 'title': 'Пикачу'}),
+                (2 ** 40, -5, 70000, {'pokemon_id': 25, 'ratio': 0.5, 'delta': -3}),
+            ]),
+            ('clusters', [(None, 2048, 2048, {'count': 12, 'pokemon_id': 1})]),
+            ('empty', []),
+        ])
+
+        layers = decode_tile(content)
+
+        self.assertEqual(set(layers), {'entities', 'clusters'})
+        entities = layers['entities']
+        self.assertEqual(entities['version'], 2)
+        self.assertEqual(entities['extent'], MVT_EXTENT)
+        self.assertEqual(entities['features'], [
+            {'id': 300, 'type': 1, 'command': 9, 'point': (10, 4000),
+             'properties': {'pokemon_id': 25, 'level': 0, 'title': 'Пикачу'}},
+            {'id': 2 ** 40, 'type': 1, 'command': 9, 'point': (-5, 70000),
+             'properties': {'pokemon_id': 25, 'ratio': 0.5, 'delta': -3}},
+        ])
+        self.assertEqual(layers['clusters']['features'], [
+            {'id': None, 'type': 1, 'command': 9, 'point': (2048, 2048),
+             'properties': {'count': 12, 'pokemon_id': 1}},
+        ])
+
+    def test_empty_tile(self):
+        self.assertEqual(encode_tile([('entities', []), ('clusters', [])]), b'')
@@ -0,0 +1,40 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from pokemon_entities import snapshot
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonEntity
+
+
+class PokemonPageEtagTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(snapshot, 'spawn_snapshot', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pokemon = Pokemon.objects.create(title='Пикачу')
+        self.url = '/pokemon/{0}/'.format(self.pokemon.id)
+
+    def write_from_other_process(self):
+        """Add active entity without signals and expire the snapshot, like a write of import_spawns."""
+        now = timezone.now()
+        PokemonEntity.objects.bulk_create([PokemonEntity(
+            pokemon=self.pokemon, latitude=55.75, longitude=37.62,
+            appear_at=now - timedelta(minutes=1), disappear_at=now + timedelta(minutes=10))])
+        snapshot.spawn_snapshot.expires_at = now
+
+    def test_etag_matches_cached_map(self):
+        first_response = self.client.get(self.url)
+        self.write_from_other_process()
+
+        second_response = self.client.get(self.url)
+
+        self.assertNotEqual(second_response['ETag'], first_response['ETag'])
+        self.assertEqual(second_response['X-Map-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first_response['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=second_response['ETag']).status_code, 304)
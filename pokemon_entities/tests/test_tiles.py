@@ -0,0 +1,40 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from pokemon_entities import geo
+from pokemon_entities import snapshot
+from pokemon_entities.models import Pokemon
+from pokemon_entities.models import PokemonEntity
+
+
+class TileCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(snapshot, 'spawn_snapshot', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pokemon = Pokemon.objects.create(title='Пикачу')
+
+    def test_tile_shows_write_of_other_process(self):
+        lat, lon = 55.75, 37.62
+        x, y = geo.latlon_to_tile(lat, lon, 16)
+        url = '/tiles/16/{0}/{1}.mvt'.format(x, y)
+        self.assertEqual(len(self.client.get(url).content), 0)
+        self.assertEqual(self.client.get(url)['X-Tile-Cache'], 'HIT')
+
+        # entity added without signals and the snapshot expired, like after import_spawns
+        now = timezone.now()
+        PokemonEntity.objects.bulk_create([PokemonEntity(
+            pokemon=self.pokemon, latitude=lat, longitude=lon, tile_key=geo.get_tile_key(lat, lon),
+            appear_at=now - timedelta(minutes=1), disappear_at=now + timedelta(minutes=10))])
+        snapshot.spawn_snapshot.expires_at = now
+
+        response = self.client.get(url)
+
+        self.assertEqual(response['X-Tile-Cache'], 'MISS')
+        self.assertGreater(len(response.content), 0)
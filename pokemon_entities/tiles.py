@@ -0,0 +1,151 @@
+"""Vector tiles of active pokemon entities.
+
+A tile contains layer 'entities' with points of entities (id of entity, pokemon_id and stats
+as properties) and, on zoom levels lower than CLUSTER_MAX_ZOOM, layer 'clusters' with points
+of clusters (count and pokemon_id of the most common specie), so size of a tile is bounded
+whatever number of entities is on the map.
+
+Entities are taken from the spawn snapshot (see snapshot.py), like in the entities API, so a tile
+shows the same entities as the API for the same part of the map.
+
+Tiles are cached under digest of the snapshot rows selected for the tile, so a write of any
+process changes the key of only tiles around the changed entity as soon as the snapshot is
+refreshed, and until the nearest moment when an entity of the tile appears or disappears.
+"""
+
+import math
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from pokemon_entities import geo
+from pokemon_entities.clustering import CLUSTER_MAX_ZOOM
+from pokemon_entities.clustering import cluster_rows
+from pokemon_entities.folium_layers import ENTITY_FIELDS
+from pokemon_entities.map_cache import get_replica_lag_window
+from pokemon_entities.mvt import MVT_EXTENT
+from pokemon_entities.mvt import encode_tile
+from pokemon_entities.snapshot import get_entity_values
+from pokemon_entities.snapshot import get_rows_digest
+from pokemon_entities.snapshot import get_spawn_snapshot
+
+
+TILE_KEY = 'mvt:{zoom}/{x}/{y}:{pokemon_id}:{version}'
+MVT_CACHE_TIMEOUT = 5 * 60
+MVT_MAX_FEATURES = 5000
+
+
+def get_tile_point(lat, lon, x, y, zoom, extent=MVT_EXTENT):
+    """Give coordinates of the point inside of Web Mercator tile.
+
+    :param lat: latitude of the point
+    :type: float
+    :param lon: longitude of the point
+    :type: float
+    :param x: x coordinate of the tile
+    :type: int
+    :param y: y coordinate of the tile
+    :type: int
+    :param zoom: zoom level of the tile
+    :type: int
+    :param extent: size of the tile in its coordinates
+    :type: int
+    :return: tuple (x, y), (0, 0) is north-west corner of the tile
+    :type: tuple
+    """
+    tiles_count = 1 << zoom
+    lat = min(max(lat, -geo.MAX_LATITUDE), geo.MAX_LATITUDE)
+    lat_rad = math.radians(lat)
+    tile_x = (lon + 180.0) / 360.0 * tiles_count
+    tile_y = (1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * tiles_count
+    return int(round((tile_x - x) * extent)), int(round((tile_y - y) * extent))
+
+
+def get_tile_bbox(x, y, zoom):
+    """Give bounding box of Web Mercator tile.
+
+    :return: tuple (min_lon, min_lat, max_lon, max_lat)
+    :type: tuple
+    """
+    max_lat, min_lon = geo.tile_to_latlon(x, y, zoom)
+    min_lat, max_lon = geo.tile_to_latlon(x + 1, y + 1, zoom)
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def build_tile(rows, x, y, zoom):
+    """Encode active pokemon entities of the tile into vector tile.
+
+    :param rows: rows of spawn snapshot of active pokemon entities inside of the tile
+    :type: ndarray
+    :param x: x coordinate of the tile
+    :type: int
+    :param y: y coordinate of the tile
+    :type: int
+    :param zoom: zoom level of the tile
+    :type: int
+    :return: the vector tile
+    :type: bytes
+    """
+    if zoom < CLUSTER_MAX_ZOOM:
+        clusters, entities = cluster_rows(rows, zoom)
+    else:
+        clusters = []
+        entities = get_entity_values(rows[:MVT_MAX_FEATURES])
+
+    entity_features = []
+    for entity in entities:
+        entity_info = dict(zip(ENTITY_FIELDS, entity))
+        tile_x, tile_y = get_tile_point(entity_info.pop('latitude'), entity_info.pop('longitude'), x, y, zoom)
+        entity_id = entity_info.pop('id')
+        entity_features.append((entity_id, tile_x, tile_y, {
+            field: value for field, value in entity_info.items() if value is not None}))
+
+    cluster_features = []
+    for cluster in clusters:
+        tile_x, tile_y = get_tile_point(cluster['latitude'], cluster['longitude'], x, y, zoom)
+        cluster_features.append((None, tile_x, tile_y, {
+            'count': cluster['count'],
+            'pokemon_id': cluster['pokemon_id'],
+        }))
+
+    return encode_tile([('entities', entity_features), ('clusters', cluster_features)])
+
+
+def get_tile(x, y, zoom, pokemon_id=None):
+    """Give vector tile from cache or build it and put to cache.
+
+    :param x: x coordinate of the tile
+    :type: int
+    :param y: y coordinate of the tile
+    :type: int
+    :param zoom: zoom level of the tile
+    :type: int
+    :param pokemon_id: id of pokemon specie to show, all species if None
+    :type: int
+    :return: tuple (the vector tile, timestamp when the tile may change, True if it was taken from cache)
+    :type: tuple
+    """
+    now = timezone.now()
+    snapshot = get_spawn_snapshot()
+    tile_bbox = get_tile_bbox(x, y, zoom)
+    rows = snapshot.select(now, tile_bbox, pokemon_id)
+    tile_key = TILE_KEY.format(zoom=zoom, x=x, y=y, pokemon_id=pokemon_id, version=get_rows_digest(rows))
+    cached_tile = cache.get(tile_key)
+    if cached_tile is not None:
+        content, expires_at = cached_tile
+        return content, expires_at, True
+
+    content = build_tile(rows, x, y, zoom)
+
+    timeout = MVT_CACHE_TIMEOUT
+    next_boundary = snapshot.get_next_boundary(now, tile_bbox, pokemon_id)
+    if next_boundary is not None:
+        timeout = min(timeout, max(int((next_boundary - timezone.now()).total_seconds()), 0))
+    lag_window = get_replica_lag_window()
+    if lag_window:
+        timeout = min(timeout, math.ceil(lag_window))
+    expires_at = time.time() + timeout
+    if timeout:
+        cache.set(tile_key, (content, expires_at), timeout)
+    return content, expires_at, False
@@ -1,160 +1,251 @@
 import folium
+import hashlib
 import json
+import time
+from datetime import timedelta
 
+from django.conf import settings
+from django.http import HttpResponse
+from django.http import HttpResponseBadRequest
+from django.http import HttpResponseForbidden
+from django.http import Http404
 from django.http import HttpResponseNotFound
+from django.http import JsonResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from folium.plugins import HeatMap
+from pokemon_entities.catalogue import get_catalogue_version
+from pokemon_entities.catalogue import get_species_by_id
+from pokemon_entities.catalogue import get_specie_info
+from pokemon_entities.catalogue import get_species_catalogue
+from pokemon_entities.catalogue import get_sprite_sheet
+from pokemon_entities.clustering import CLUSTER_MAX_ZOOM
+from pokemon_entities.clustering import cluster_rows
+from pokemon_entities.clustering import get_clusters_by_zoom
+from pokemon_entities.db_router import iter_with_replica_reads
+from pokemon_entities.db_router import replica_reads
+from pokemon_entities.evolutions import get_evolution_chain
+from pokemon_entities.folium_layers import ApiEntitiesLayer
+from pokemon_entities.folium_layers import ENTITY_FIELDS
+from pokemon_entities.folium_layers import SpeciesMarkersLayer
+from pokemon_entities.heatmap import get_heatmap
+from pokemon_entities.images import get_image_url
+from pokemon_entities.live import iter_spawn_events
+from pokemon_entities.map_cache import get_map_html
+from pokemon_entities.matchups import get_matchup_matrix
+from pokemon_entities.metrics import export_metrics
+from pokemon_entities.metrics import measure
+from pokemon_entities.snapshot import STAT_FIELDS
+from pokemon_entities.snapshot import get_entity_values
+from pokemon_entities.snapshot import get_rows_digest
+from pokemon_entities.snapshot import get_spawn_snapshot
+from pokemon_entities.tiles import get_tile
 from pokemon_entities.models import Pokemon
 from pokemon_entities.models import PokemonEntity
 
 
 MOSCOW_CENTER = [55.751244, 37.618423]
+ENTITIES_API_MAX_FEATURES = 1000
+NEAREST_MAX_COUNT = 100
+MAX_ZOOM = 20
+PAGE_MAX_AGE = 30
+HEATMAP_DAYS = 7
+TILE_MAX_AGE = 60
 DEFAULT_IMAGE_URL = "https://vignette.wikia.nocookie.net/pokemon/images/6/6e/%21.png/revision/latest/fixed-aspect-ratio-down/width/240/height/240?cb=20130525215832&fill=transparent"
 
 
-def add_pokemon(folium_map, pokemon_entity_info, image_url=DEFAULT_IMAGE_URL):
-    """Add pokemon entities and popups about them to the map.
+def get_species_icon(request, specie, sprite_sheet=None):
+    """Give info about pokemon specie which is needed to draw its markers on the map.
 
-    The function form the map in which add pokemon info. Info contain image 
-    with tooltip and popup message. If pokemon entity have not feature level, 
-    then popup message is 'no data'.    
+    The map is rendered inside of iframe with data: URL, so image URLs must be absolute.
 
-    :param folium_map: name of schoolkid 
-    :type: Folium.Map object
-    :param pokemon_entity_info: list of main features of pokemon entity
-    :type: list
-    :param image_url: path to image of pokemon specie
+    :param request: 
+    :type: HttpRequest
+    :param specie: pokemon specie from species catalogue
+    :type: dict
+    :param sprite_sheet: manifest of the sprite sheet with icons of species
+    :type: dict
+    :return: dict with title and image URL of pokemon specie, and with URL of the sprite sheet 
+             and position of the icon in it if the icon is there
+    :type: dict
+    """
+    species_icon = {
+        'title': specie['title_ru'],
+        'image_url': request.build_absolute_uri(specie['img_url']) if specie['img_url'] else DEFAULT_IMAGE_URL,
+    }
+    if sprite_sheet and specie['sprite_position']:
+        species_icon['sprite_url'] = request.build_absolute_uri(sprite_sheet['url'])
+        species_icon['sprite_position'] = specie['sprite_position']
+    return species_icon
+
+
+def get_species_icons(request, pokemon_ids):
+    """Give info about pokemon species which is needed to draw their markers on the map.
+
+    :param request: 
+    :type: HttpRequest
+    :param pokemon_ids: ids of pokemon species
+    :type: set
+    :return: dict like {pokemon_id: result of get_species_icon()}
+    :type: dict
+    """
+    species_by_id = get_species_by_id()
+    sprite_sheet = get_sprite_sheet()
+    return {
+        pokemon_id: get_species_icon(request, species_by_id[pokemon_id], sprite_sheet)
+        for pokemon_id in pokemon_ids
+        if pokemon_id in species_by_id
+    }
+
+
+def make_etag(*parts):
+    """Give ETag made of the release, versions of data and other parts which change the page."""
+    return hashlib.md5(repr((settings.RELEASE,) + parts).encode('utf-8')).hexdigest()
+
+
+def get_mainpage_etag(request):
+    """Give ETag of the main page, it changes only with species, map is loaded by the API."""
+    return make_etag('mainpage', request.get_host(), get_catalogue_version())
+
+
+def make_pokemon_page_etag(request, pokemon_id, entities_version):
+    """Give ETag of pokemon page made of the same versions as the key of its cached map.
+
+    :param request: 
+    :type: HttpRequest
+    :param pokemon_id: id of pokemon specie
+    :type: int
+    :param entities_version: digest of rows of the spawn snapshot shown on the map of the page
+    :type: string
+    :return: ETag without quotes
     :type: string
     """
-    if pokemon_entity_info['level']:
-        popup_message = '<table><tr><td>Ур:</td><td>{0}</td></tr> \
-            <tr><td>Зд:</td><td>{1}</td></tr> \
-            <tr><td>Сил:</td><td>{2}</td></tr> \
-            <tr><td>Защ:</td><td>{3}</td></tr> \
-            <tr><td>Вын:</td><td>{4}</td></tr></table>'.format(
-            pokemon_entity_info['level'], pokemon_entity_info['health'], pokemon_entity_info['strength'],
-            pokemon_entity_info['defence'], pokemon_entity_info['stamina'])
-    else:
-        popup_message = 'Нет данных'
-
-    icon = folium.features.CustomIcon(
-        image_url,
-        icon_size=(50, 50),
-    )
-    folium.Marker(
-        [pokemon_entity_info['latitude'], pokemon_entity_info['longitude']],
-        tooltip=pokemon_entity_info['title'],
-        icon=icon,
-        popup=popup_message
+    return make_etag('pokemon', request.get_host(), pokemon_id, get_catalogue_version(), entities_version)
+
+
+def get_pokemon_page_etag(request, pokemon_id):
+    """Give ETag of pokemon page.
+
+    ETag is made of species and active entities of the pokemon taken from the spawn snapshot,
+    which the map of the page is rendered from, so ETag changes when any entity of the pokemon
+    appears, disappears or changes, and costs no queries. show_pokemon() sets ETag of its
+    response from the rows it has rendered, so the ETag always matches the page.
+    """
+    try:
+        pokemon_id = int(pokemon_id)
+    except ValueError:
+        return None
+    active_rows = get_spawn_snapshot().select(timezone.now(), pokemon_id=pokemon_id)
+    return make_pokemon_page_etag(request, pokemon_id, get_rows_digest(active_rows))
+
+
+def render_api_map(build_absolute_uri, pokemon_id=None):
+    """Give HTML of the map which loads active pokemon entities from the entities API.
+
+    :param build_absolute_uri: function which gives absolute URL of path, the map is rendered
+                               inside of iframe with data: URL
+    :type: function
+    :param pokemon_id: id of pokemon specie to show, all species if None
+    :type: int
+    :return: HTML of the map
+    :type: string
+    """
+    folium_map = folium.Map(location=MOSCOW_CENTER, zoom_start=12)
+    ApiEntitiesLayer(
+        build_absolute_uri(reverse('api_entities')),
+        pokemon_id=pokemon_id,
+        stream_url=build_absolute_uri(reverse('api_entities_stream')),
+        cluster_max_zoom=CLUSTER_MAX_ZOOM,
     ).add_to(folium_map)
+    with measure('folium'):
+        return folium_map._repr_html_()
 
 
+@replica_reads()
+@cache_control(public=True, max_age=PAGE_MAX_AGE)
+@condition(etag_func=get_mainpage_etag)
 def show_all_pokemons(request):
     """Give information about all pokemon and active pokemon entities.
 
-    The function get info about all pokemons in DB, get and add all active pokemon entities in the map. 
-    Active means current time that between appear_at and disappear_at of pokemon entity. After that 
-    function form data for render function which show this data    
+    The function get info about all pokemons from species catalogue and form the map which loads active pokemon
+    entities from the entities API only for the visible part of the map. After that function form 
+    data for render function which show this data    
 
     :param request: 
     :type: HttpRequest
     :return: result of applying the render function (html with current context)
     :type: HttpResponse
     """
-    pokemons_on_page = []
-    pokemons = Pokemon.objects.all()
-    pokemon_entities = PokemonEntity.objects.filter(
-        appear_at__lte=timezone.now(), disappear_at__gte=timezone.now()).select_related('pokemon')
+    def render_map():
+        return render_api_map(request.build_absolute_uri)
 
-    folium_map = folium.Map(location=MOSCOW_CENTER, zoom_start=12)
-    for pokemon_entity in pokemon_entities:
-        pokemon_entity_info = {
-            'title': pokemon_entity.pokemon.title,
-            'latitude': pokemon_entity.latitude,
-            'longitude': pokemon_entity.longitude,
-            'level': pokemon_entity.level,
-            'health': pokemon_entity.health,
-            'strength': pokemon_entity.strength,
-            'defence': pokemon_entity.defence,
-            'stamina': pokemon_entity.stamina,
-        }
-        add_pokemon(folium_map, pokemon_entity_info,
-                    pokemon_entity.pokemon.image.path)
-
-    for pokemon in pokemons:
-        pokemons_on_page.append({
-            'pokemon_id': pokemon.id,
-            'img_url': pokemon.image.url if pokemon.image else None,
-            'title_ru': pokemon.title,
+    map_html, from_cache = get_map_html(request, 'mainpage', render_map)
+    with measure('query'):
+        pokemons = get_species_catalogue()
+        sprite_sheet = get_sprite_sheet()
+    with measure('render'):
+        response = render(request, "mainpage.html", context={
+            'map': map_html,
+            'pokemons': pokemons,
+            'sprite_sheet': sprite_sheet,
         })
+    response['X-Map-Cache'] = 'HIT' if from_cache else 'MISS'
+    return response
 
-    return render(request, "mainpage.html", context={
-        'map': folium_map._repr_html_(),
-        'pokemons': pokemons_on_page,
-    })
 
+def get_page_pokemons():
+    """Give pokemons with everything which is shown on pokemon page.
 
-def show_pokemon(request, pokemon_id):
-    """Give information about pokemon with current id and his active pokemon entities.
+    :return: queryset of pokemons
+    :type: QuerySet
+    """
+    return Pokemon.objects.select_related('previous_evolution').prefetch_related(
+        'next_evolution', 'element_type', 'element_type__strong_against')
 
-    The function get info about current pokemon(with current id), get and add all active pokemon entities 
-    in the map. Active means current time that between appear_at and disappear_at of pokemon entity. 
-    After that function do data for render function which show this data    
 
-    :param request: 
-    :type: HttpRequest
-    :param pokemon_id: id of pokemon by which the function get current pokemon 
-    :type: int
-    :return: result of applying the render function (html with current context)
-    :type: HttpResponse
+def get_pokemon_on_page(requested_pokemon):
+    """Give info about pokemon for pokemon.html.
+
+    :param requested_pokemon: pokemon from get_page_pokemons()
+    :type: Pokemon
+    :return: dict with pokemon info, its evolutions and element types
+    :type: dict
     """
     previous_evolution = None
     next_evolution = None
 
-    try:
-        requested_pokemon = Pokemon.objects.select_related('previous_evolution').prefetch_related(
-            'next_evolution', 'element_type', 'element_type__strong_against').get(id=int(pokemon_id))
-    except Pokemon.DoesNotExist as no_pokemon:
-        return HttpResponseNotFound('<h1>Такой покемон не найден</h1>')
-
-    requested_pokemon_entities = PokemonEntity.objects.filter(
-        pokemon=requested_pokemon, appear_at__lte=timezone.now(),
-        disappear_at__gte=timezone.now())
-
-    folium_map = folium.Map(location=MOSCOW_CENTER, zoom_start=12)
-    for pokemon_entity in requested_pokemon_entities:
-        pokemon_entity_info = {
-            'title': requested_pokemon.title,
-            'latitude': pokemon_entity.latitude,
-            'longitude': pokemon_entity.longitude,
-            'level': pokemon_entity.level,
-            'health': pokemon_entity.health,
-            'strength': pokemon_entity.strength,
-            'defence': pokemon_entity.defence,
-            'stamina': pokemon_entity.stamina,
-        }
-        add_pokemon(folium_map, pokemon_entity_info,
-                    requested_pokemon.image.path)
-
     if requested_pokemon.previous_evolution:
         requested_previous_evolution = requested_pokemon.previous_evolution
         previous_evolution = {
             'pokemon_id': requested_previous_evolution.id,
-            'img_url': requested_previous_evolution.image.url if requested_previous_evolution.image else None,
+            'img_url': get_image_url(requested_previous_evolution, 'icon'),
+            'img_webp_url': get_image_url(requested_previous_evolution, 'icon', 'webp'),
             'title_ru': requested_previous_evolution.title, }
 
     next_evolution_set = requested_pokemon.next_evolution.all()
     if next_evolution_set:
         next_evolution = {
             'pokemon_id': next_evolution_set[0].id,
-            'img_url': next_evolution_set[0].image.url if next_evolution_set[0].image else None,
+            'img_url': get_image_url(next_evolution_set[0], 'icon'),
+            'img_webp_url': get_image_url(next_evolution_set[0], 'icon', 'webp'),
         }
 
+    with measure('query'):
+        evolution_chain = get_evolution_chain(requested_pokemon)
+
     if requested_pokemon.element_type:
         element_type = []
         for element in requested_pokemon.element_type.all():
             element_type.append({'title': element.title,
-                                 'img': element.image.url if element.image.url else None,
+                                 'img': get_image_url(element, 'element'),
+                                 'img_webp': get_image_url(element, 'element', 'webp'),
                                  'strong_against': element.strong_against.all(), })
 
     pokemon_on_page = {
@@ -163,11 +254,384 @@ def show_pokemon(request, pokemon_id):
         'title_en': requested_pokemon.title_en,
         'title_jp': requested_pokemon.title_jp,
         'description': requested_pokemon.description,
-        'img_url': requested_pokemon.image.url if requested_pokemon.image else None,
+        'img_url': get_image_url(requested_pokemon, 'card'),
+        'img_webp_url': get_image_url(requested_pokemon, 'card', 'webp'),
         'previous_evolution': previous_evolution,
         'next_evolution': next_evolution,
+        'evolution_chain': evolution_chain if len(evolution_chain) > 1 else [],
         'element_type': element_type,
     }
+    return pokemon_on_page
+
+
+@replica_reads()
+@cache_control(public=True, max_age=PAGE_MAX_AGE)
+@condition(etag_func=get_pokemon_page_etag)
+def show_pokemon(request, pokemon_id):
+    """Give information about pokemon with current id and his active pokemon entities.
+
+    The function get info about current pokemon(with current id) and its whole evolution chain, get and 
+    add all active pokemon entities in the map. Active means current time that between appear_at and disappear_at of pokemon entity. 
+    After that function do data for render function which show this data    
+
+    :param request: 
+    :type: HttpRequest
+    :param pokemon_id: id of pokemon by which the function get current pokemon 
+    :type: int
+    :return: result of applying the render function (html with current context)
+    :type: HttpResponse
+    """
+    try:
+        with measure('query'):
+            requested_pokemon = get_page_pokemons().get(id=int(pokemon_id))
+    except Pokemon.DoesNotExist as no_pokemon:
+        return HttpResponseNotFound('<h1>Такой покемон не найден</h1>')
+
+    # the catalogue may be older than the pokemon which is just created by other process
+    specie = get_species_by_id().get(requested_pokemon.id) or get_specie_info(requested_pokemon)
+    snapshot = get_spawn_snapshot()
+    requested_rows = snapshot.select(timezone.now(), pokemon_id=requested_pokemon.id)
+    entities_version = get_rows_digest(requested_rows)
+
+    def render_map():
+        folium_map = folium.Map(location=MOSCOW_CENTER, zoom_start=12)
+        with measure('markers'):
+            SpeciesMarkersLayer(
+                {requested_pokemon.id: get_species_icon(request, specie, get_sprite_sheet())},
+                get_entity_values(requested_rows),
+                clusters=get_clusters_by_zoom(requested_rows),
+                cluster_max_zoom=CLUSTER_MAX_ZOOM,
+            ).add_to(folium_map)
+        with measure('heatmap'):
+            now = timezone.now()
+            heatmap = get_heatmap(now - timedelta(days=HEATMAP_DAYS), now, requested_pokemon.id)
+        if heatmap:
+            max_count = max(count for latitude, longitude, count in heatmap)
+            HeatMap(
+                [[latitude, longitude, count / max_count] for latitude, longitude, count in heatmap],
+                name='Где появлялся за {0} дней'.format(HEATMAP_DAYS),
+                show=False,
+            ).add_to(folium_map)
+            folium.LayerControl().add_to(folium_map)
+        with measure('folium'):
+            return folium_map._repr_html_()
+
+    map_html, from_cache = get_map_html(
+        request, 'pokemon', render_map,
+        entities_version=entities_version,
+        get_next_boundary=lambda now: snapshot.get_next_boundary(now, pokemon_id=requested_pokemon.id),
+        pokemon_id=requested_pokemon.id,
+    )
+
+    pokemon_on_page = get_pokemon_on_page(requested_pokemon)
+
+    with measure('render'):
+        response = render(request, "pokemon.html", context={'map': map_html,
+                                                            'pokemon': pokemon_on_page})
+    response['X-Map-Cache'] = 'HIT' if from_cache else 'MISS'
+    # entities may change after get_pokemon_page_etag(), so ETag is made of what the page shows
+    response['ETag'] = quote_etag(make_pokemon_page_etag(request, requested_pokemon.id, entities_version))
+    return response
 
-    return render(request, "pokemon.html", context={'map': folium_map._repr_html_(),
-                                                    'pokemon': pokemon_on_page})
+
+def parse_bbox(raw_bbox):
+    """Parse bounding box from string like 'min_lon,min_lat,max_lon,max_lat'.
+
+    :param raw_bbox: bounding box in GeoJSON order
+    :type: string
+    :return: tuple (min_lon, min_lat, max_lon, max_lat)
+    :type: tuple
+    :raises ValueError: if bounding box is malformed
+    """
+    min_lon, min_lat, max_lon, max_lat = [float(value) for value in raw_bbox.split(',')]
+    if not (-90 <= min_lat <= max_lat <= 90):
+        raise ValueError('Latitude is out of range')
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError('Longitude is out of range')
+    return min_lon, min_lat, max_lon, max_lat
+
+
+@replica_reads()
+def show_pokemon_entities(request):
+    """Give active pokemon entities inside of bounding box as GeoJSON.
+
+    The function get active pokemon entities which lie in the requested bounding box (the visible part 
+    of the map) and optionally belong to the requested pokemon specie. On zoom levels lower than 
+    CLUSTER_MAX_ZOOM close entities are grouped into clusters (features with property 'cluster'), 
+    on higher levels not more than ENTITIES_API_MAX_FEATURES entities are returned, flag 'truncated' 
+    shows that some were left out.
+
+    Query parameters: bbox ('min_lon,min_lat,max_lon,max_lat', required), zoom (map zoom level) 
+    and pokemon_id (id of pokemon specie).
+
+    :param request: 
+    :type: HttpRequest
+    :return: GeoJSON FeatureCollection with pokemon entities, titles and icons of their species 
+             are given once for every specie in member 'species'
+    :type: JsonResponse
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = parse_bbox(request.GET['bbox'])
+        zoom = int(request.GET.get('zoom', MAX_ZOOM))
+        pokemon_id = request.GET.get('pokemon_id')
+        pokemon_id = int(pokemon_id) if pokemon_id else None
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('<h1>Неверные параметры запроса</h1>')
+    zoom = min(max(zoom, 0), MAX_ZOOM)
+
+    with measure('query'):
+        rows = get_spawn_snapshot().select(timezone.now(), (min_lon, min_lat, max_lon, max_lat), pokemon_id)
+        if zoom < CLUSTER_MAX_ZOOM:
+            clusters, entities = cluster_rows(rows, zoom)
+        else:
+            clusters = []
+            entities = get_entity_values(rows[:ENTITIES_API_MAX_FEATURES + 1])
+    truncated = len(entities) > ENTITIES_API_MAX_FEATURES
+    entities = entities[:ENTITIES_API_MAX_FEATURES]
+
+    features = []
+    for cluster in clusters:
+        features.append({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [cluster['longitude'], cluster['latitude']],
+            },
+            'properties': {
+                'cluster': True,
+                'count': cluster['count'],
+                'pokemon_id': cluster['pokemon_id'],
+            },
+        })
+    for entity in entities:
+        entity_info = dict(zip(ENTITY_FIELDS, entity))
+        features.append({
+            'type': 'Feature',
+            'id': entity_info.pop('id'),
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [entity_info.pop('longitude'), entity_info.pop('latitude')],
+            },
+            'properties': entity_info,
+        })
+
+    response = JsonResponse({
+        'type': 'FeatureCollection',
+        'zoom': zoom,
+        'truncated': truncated,
+        'features': features,
+        'species': get_species_icons(request, {feature['properties']['pokemon_id'] for feature in features}),
+    })
+    # the map is rendered inside of iframe with data: URL, so its requests are cross-origin
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+@replica_reads()
+def show_heatmap(request):
+    """Give number of spawns by cells of the map for the time range.
+
+    Query parameters: start and end in ISO 8601 (last HEATMAP_DAYS days by default) and 
+    optional pokemon_id. Counts are taken from the rollup table (see heatmap.py).
+
+    :param request: 
+    :type: HttpRequest
+    :return: list of [latitude, longitude, count] of centers of cells
+    :type: JsonResponse
+    """
+    now = timezone.now()
+    try:
+        start = parse_datetime(request.GET['start']) if request.GET.get('start') else now - timedelta(days=HEATMAP_DAYS)
+        end = parse_datetime(request.GET['end']) if request.GET.get('end') else now
+        pokemon_id = request.GET.get('pokemon_id')
+        pokemon_id = int(pokemon_id) if pokemon_id else None
+    except ValueError:
+        return HttpResponseBadRequest('<h1>Неверные параметры запроса</h1>')
+    if start is None or end is None:
+        return HttpResponseBadRequest('<h1>Неверные параметры запроса</h1>')
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    if timezone.is_naive(end):
+        end = timezone.make_aware(end)
+
+    with measure('query'):
+        heatmap = get_heatmap(start, end, pokemon_id)
+    response = JsonResponse({'start': start, 'end': end, 'cells': heatmap})
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+@replica_reads()
+def show_tile(request, zoom, x, y):
+    """Give Mapbox Vector Tile with active pokemon entities.
+
+    Query parameter pokemon_id limits the tile to one specie. HTTP caches may keep the tile
+    until an entity of the tile appears or disappears, but not longer than TILE_MAX_AGE, 
+    because they don't know about writes.
+
+    :param request: 
+    :type: HttpRequest
+    :param zoom: zoom level of the tile
+    :type: int
+    :param x: x coordinate of the tile
+    :type: int
+    :param y: y coordinate of the tile
+    :type: int
+    :return: the vector tile
+    :type: HttpResponse
+    """
+    if not (0 <= zoom <= MAX_ZOOM and 0 <= x < 1 << zoom and 0 <= y < 1 << zoom):
+        raise Http404('Такого тайла нет')
+    try:
+        pokemon_id = request.GET.get('pokemon_id')
+        pokemon_id = int(pokemon_id) if pokemon_id else None
+    except ValueError:
+        return HttpResponseBadRequest('<h1>Неверные параметры запроса</h1>')
+
+    with measure('query'):
+        content, expires_at, from_cache = get_tile(x, y, zoom, pokemon_id)
+    response = HttpResponse(content, content_type='application/vnd.mapbox-vector-tile')
+    patch_cache_control(response, public=True,
+                        max_age=min(max(int(expires_at - time.time()), 0), TILE_MAX_AGE))
+    response['Access-Control-Allow-Origin'] = '*'
+    response['X-Tile-Cache'] = 'HIT' if from_cache else 'MISS'
+    return response
+
+
+def show_pokemon_entities_stream(request):
+    """Stream live changes of active pokemon entities inside of bounding box as Server-Sent Events.
+
+    Query parameters are the same as of the entities API: bbox and optional pokemon_id. 
+    The stream starts with snapshot of active entities and then sends only appeared and 
+    disappeared ones (see live.py).
+
+    :param request: 
+    :type: HttpRequest
+    :return: stream of events
+    :type: StreamingHttpResponse
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = parse_bbox(request.GET['bbox'])
+        pokemon_id = request.GET.get('pokemon_id')
+        pokemon_id = int(pokemon_id) if pokemon_id else None
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('<h1>Неверные параметры запроса</h1>')
+
+    response = StreamingHttpResponse(
+        iter_with_replica_reads(iter_spawn_events(
+            (min_lon, min_lat, max_lon, max_lat),
+            pokemon_id,
+            lambda pokemon_ids: get_species_icons(request, pokemon_ids),
+            ENTITIES_API_MAX_FEATURES,
+        )),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # proxies like nginx must not buffer events
+    response['X-Accel-Buffering'] = 'no'
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+@replica_reads()
+def show_nearest_pokemon_entities(request):
+    """Give active pokemon entities nearest to the point.
+
+    Query parameters: lat and lon of the point, count (10 by default, not more than 
+    NEAREST_MAX_COUNT), optional pokemon_id and optional min_level, min_health, min_strength, 
+    min_defence, min_stamina.
+
+    :param request: 
+    :type: HttpRequest
+    :return: list of entities with distance in meters, nearest first
+    :type: JsonResponse
+    """
+    try:
+        lat = float(request.GET['lat'])
+        lon = float(request.GET['lon'])
+        count = min(int(request.GET.get('count', 10)), NEAREST_MAX_COUNT)
+        pokemon_id = request.GET.get('pokemon_id')
+        pokemon_id = int(pokemon_id) if pokemon_id else None
+        min_stats = {
+            field: int(request.GET['min_' + field])
+            for field in STAT_FIELDS
+            if request.GET.get('min_' + field)
+        }
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('<h1>Неверные параметры запроса</h1>')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or count < 1:
+        return HttpResponseBadRequest('<h1>Неверные параметры запроса</h1>')
+
+    species_by_id = get_species_by_id()
+    with measure('query'):
+        nearest_entities = PokemonEntity.objects.nearest(lat, lon, count, pokemon_id, min_stats)
+    entities = []
+    for entity in nearest_entities:
+        entity_info = {field: getattr(entity, field) for field in ENTITY_FIELDS}
+        entity_info['title_ru'] = species_by_id.get(entity.pokemon_id, {}).get('title_ru')
+        entity_info['distance_m'] = round(entity.distance_m, 1)
+        entities.append(entity_info)
+    return JsonResponse({'entities': entities})
+
+
+@replica_reads()
+def show_counters(request, pokemon_id=None):
+    """Give pokemon species ranked by advantage over the pokemon or the element types.
+
+    Defending element types are taken from pokemon with pokemon_id or from query parameter 
+    types (comma separated ids of element types). Query parameter limit sets number of species 
+    in the answer, 10 by default. All species are ranked at once by the matchup matrix.
+
+    :param request: 
+    :type: HttpRequest
+    :param pokemon_id: id of the defending pokemon
+    :type: int
+    :return: defending element types and list of counters with advantage, offence and threat
+    :type: JsonResponse
+    """
+    try:
+        limit = int(request.GET.get('limit', 10))
+        if pokemon_id is None:
+            element_ids = [int(element_id) for element_id in request.GET['types'].split(',') if element_id]
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('<h1>Неверные параметры запроса</h1>')
+
+    species_by_id = get_species_by_id()
+    matchup_matrix = get_matchup_matrix()
+    if pokemon_id is not None:
+        pokemon_id = int(pokemon_id)
+        if pokemon_id not in species_by_id:
+            raise Http404('Такой покемон не найден')
+        element_ids = matchup_matrix.get_species_types(pokemon_id)
+
+    counters = []
+    for counter_id, advantage, offence, threat in zip(*matchup_matrix.rank_counters(element_ids)):
+        if len(counters) >= limit:
+            break
+        counter_id = int(counter_id)
+        if counter_id == pokemon_id or counter_id not in species_by_id:
+            continue
+        counters.append({
+            'pokemon_id': counter_id,
+            'title_ru': species_by_id[counter_id]['title_ru'],
+            'advantage': float(advantage),
+            'offence': float(offence),
+            'threat': float(threat),
+        })
+    return JsonResponse({'types': element_ids, 'counters': counters})
+
+
+def show_metrics(request):
+    """Give metrics of views of this process in Prometheus text format.
+
+    Metrics are available only from addresses listed in METRICS_ALLOWED_IPS setting and are 
+    collected only when MetricsMiddleware is on.
+
+    :param request: 
+    :type: HttpRequest
+    :return: metrics in Prometheus text format
+    :type: HttpResponse
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden('<h1>Доступ запрещён</h1>')
+    return HttpResponse(export_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,16 @@
+"""Setup of worker processes of management commands.
+
+Workers of multiprocessing.Pool inherit configured Django only with the 'fork' start method.
+With 'spawn' (default on macOS and Windows) they start a fresh interpreter, so Django must be
+set up there before tasks are unpickled. This module doesn't import models, so the initializer
+may be unpickled by a worker where Django is not set up yet.
+"""
+
+import django
+from django.db import connections
+
+
+def setup_worker():
+    """Set up Django in worker process and close database connections inherited by fork."""
+    django.setup()
+    connections.close_all()